@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Incremental WireViz build for the wiring-*.yml family
+
+Only files whose content changed since the last build are re-rendered,
+and renders run in parallel (one wireviz process per file). The build
+also writes hal_index.json, which maps HAL signal names from the
+linuxcnc_test_config .hal files to the connector pins and wires that
+carry them.
+
+A connector pin is linked to a HAL signal when its pin label is the
+signal name (e.g. `x-enable`) or a dotted part of a HAL pin name on that
+signal (e.g. `gpio.012` for `hm2_7c81.0.gpio.012.out`).
+
+Usage:
+    uv run python Wiring/build.py [-f svg -f png] [--jobs N] [--force]
+    uv run python Wiring/build.py which x-enable [--config ethercat-rpi-test]
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+WIRING_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_DIR = os.path.join(os.path.dirname(WIRING_DIR), "linuxcnc_test_config")
+CACHE_FILE = os.path.join(WIRING_DIR, ".build-cache.json")
+INDEX_FILE = os.path.join(WIRING_DIR, "hal_index.json")
+
+# wireviz -f codes and the output file each one produces
+FORMAT_SUFFIXES = {"h": ".html", "p": ".png", "s": ".svg", "P": ".pdf", "t": ".bom.tsv",
+                   "g": ".gv"}
+DEFAULT_FORMATS = "hpst"
+FORMAT_NAMES = {"html": "h", "png": "p", "svg": "s", "pdf": "P", "tsv": "t", "gv": "g"}
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_cache():
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    tmp_path = CACHE_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, CACHE_FILE)
+
+
+def outputs_exist(path, formats):
+    stem = os.path.splitext(path)[0]
+    return all(os.path.exists(stem + FORMAT_SUFFIXES[code])
+               for code in formats if code in FORMAT_SUFFIXES)
+
+
+def render(path, formats):
+    """Run wireviz on one file, returns (path, error text or None)"""
+    try:
+        result = subprocess.run(["wireviz", "-f", formats, path],
+                                capture_output=True, text=True)
+    except FileNotFoundError:
+        return path, "wireviz not found (run with `uv run`)"
+    if result.returncode != 0:
+        return path, (result.stderr or result.stdout).strip()
+    return path, None
+
+
+def build(formats=DEFAULT_FORMATS, jobs=None, force=False):
+    """Render changed wiring-*.yml files in parallel
+
+    Returns the number of failed renders.
+    """
+    cache = load_cache()
+    todo = []
+    for path in sorted(glob.glob(os.path.join(WIRING_DIR, "wiring-*.yml"))):
+        name = os.path.basename(path)
+        if os.path.getsize(path) == 0:
+            print(f"  {name}: empty, skipped")
+            continue
+        digest = file_hash(path)
+        entry = cache.get(name, {})
+        if (not force and entry.get("hash") == digest and entry.get("formats") == formats
+                and outputs_exist(path, formats)):
+            print(f"  {name}: up to date")
+            continue
+        todo.append((path, digest))
+
+    failures = 0
+    if todo:
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            hashes = dict(todo)
+            for path, error in pool.map(lambda item: render(item[0], formats), todo):
+                name = os.path.basename(path)
+                if error:
+                    failures += 1
+                    cache.pop(name, None)
+                    print(f"  {name}: FAILED\n{error}")
+                else:
+                    cache[name] = {"hash": hashes[path], "formats": formats}
+                    print(f"  {name}: rendered")
+        save_cache(cache)
+    return failures
+
+
+def parse_hal_signals(config_dir=CONFIG_DIR):
+    """Map config name -> HAL signal name -> {hal file: [pins]}
+
+    The config is the first directory under config_dir, so same-named
+    signals in unrelated configs stay apart.
+    """
+    configs = {}
+    for path in sorted(glob.glob(os.path.join(config_dir, "**", "*.hal"), recursive=True)):
+        rel_path = os.path.relpath(path, os.path.dirname(WIRING_DIR))
+        config = os.path.relpath(path, config_dir).split(os.sep)[0]
+        signals = configs.setdefault(config, {})
+        with open(path) as f:
+            for line in f:
+                words = line.split("#", 1)[0].split()
+                if len(words) < 2 or words[0] != "net":
+                    continue
+                pins = [word for word in words[2:] if word not in ("=>", "<=", "<=>")]
+                signals.setdefault(words[1], {}).setdefault(rel_path, []).extend(pins)
+    return configs
+
+
+def expand_pins(spec):
+    """Turn a WireViz pin spec (list, scalar or 'a-b' range) into a list"""
+    if spec is None:
+        return []
+    items = spec if isinstance(spec, list) else [spec]
+    pins = []
+    for item in items:
+        match = re.fullmatch(r"(\d+)-(\d+)", str(item))
+        if match:
+            first, last = int(match.group(1)), int(match.group(2))
+            step = 1 if last >= first else -1
+            pins.extend(range(first, last + step, step))
+        else:
+            pins.append(item)
+    return pins
+
+
+def wire_paths(doc):
+    """Yield one list of (name, pin) hops per wire in each connection set"""
+    for chain in doc.get("connections") or []:
+        hops = []
+        for element in chain:
+            if isinstance(element, dict):
+                for name, spec in element.items():
+                    hops.append((name, expand_pins(spec)))
+            else:
+                hops.append((str(element), [None]))
+        width = max((len(pins) for _, pins in hops), default=0)
+        for position in range(width):
+            path = []
+            for name, pins in hops:
+                pin = pins[position] if len(pins) > 1 else (pins[0] if pins else None)
+                path.append((name, pin))
+            yield path
+
+
+def label_of(connector, pin):
+    """Pin label for a connector pin number (or the pin itself)"""
+    labels = connector.get("pinlabels") or []
+    if isinstance(pin, int) and 1 <= pin <= len(labels) and not connector.get("pins"):
+        return str(labels[pin - 1])
+    return str(pin)
+
+
+def label_map(signals):
+    """Pin label -> signal, from signal names and dotted runs of HAL pin names"""
+    label_to_signal = {}
+    for signal, files in signals.items():
+        label_to_signal[signal] = signal
+        for pins in files.values():
+            for hal_pin in pins:
+                label_to_signal.setdefault(hal_pin, signal)
+                parts = hal_pin.split(".")
+                for start in range(len(parts)):
+                    for end in range(start + 2, len(parts) + 1):
+                        label_to_signal.setdefault(".".join(parts[start:end]), signal)
+    return label_to_signal
+
+
+def index_config(signals, docs):
+    """Cross-reference one config's HAL signals to connector pins and wires"""
+    label_to_signal = label_map(signals)
+    index = {signal: {"hal": files, "wiring": []} for signal, files in signals.items()}
+    for name, doc in docs:
+        connectors = doc.get("connectors") or {}
+        cables = doc.get("cables") or {}
+
+        # Connector pins whose label names a signal
+        for conn_name, connector in connectors.items():
+            for label in (connector or {}).get("pinlabels") or []:
+                signal = label_to_signal.get(str(label))
+                if signal:
+                    index[signal]["wiring"].append({"file": name, "connector": conn_name,
+                                                    "pin": str(label)})
+
+        # Wires that land on one of those pins
+        for hops in wire_paths(doc):
+            labels = [(n, label_of(connectors[n] or {}, pin)) for n, pin in hops
+                      if n in connectors]
+            signal = next((label_to_signal[label] for _, label in labels
+                           if label in label_to_signal), None)
+            if signal is None:
+                continue
+            for cable_name, wire in hops:
+                if cable_name not in cables:
+                    continue
+                colors = (cables[cable_name] or {}).get("colors") or []
+                color = colors[wire - 1] if isinstance(wire, int) and 0 < wire <= len(colors) else None
+                index[signal]["wiring"].append({
+                    "file": name, "cable": cable_name, "wire": wire, "color": color,
+                    "ends": [f"{n}:{label}" for n, label in labels],
+                })
+    return index
+
+
+def build_index(configs=None):
+    """Index every config: config name -> signal -> HAL pins and wiring"""
+    configs = parse_hal_signals() if configs is None else configs
+    docs = []
+    for path in sorted(glob.glob(os.path.join(WIRING_DIR, "wiring-*.yml"))):
+        with open(path) as f:
+            docs.append((os.path.basename(path), yaml.safe_load(f) or {}))
+    return {config: index_config(signals, docs) for config, signals in configs.items()}
+
+
+def index_sources():
+    """Files the index is built from"""
+    return (glob.glob(os.path.join(CONFIG_DIR, "**", "*.hal"), recursive=True)
+            + glob.glob(os.path.join(WIRING_DIR, "wiring-*.yml")))
+
+
+def index_is_stale():
+    """True if hal_index.json is missing or older than any .hal/.yml source"""
+    try:
+        built = os.path.getmtime(INDEX_FILE)
+    except OSError:
+        return True
+    return any(os.path.getmtime(path) > built for path in index_sources())
+
+
+def write_index(index):
+    tmp_path = INDEX_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, INDEX_FILE)
+
+
+def which(signal, config=None):
+    """Print where a HAL signal is wired, from hal_index.json
+
+    The index is rebuilt first if any .hal or wiring file changed.
+    """
+    if index_is_stale():
+        write_index(build_index())
+    with open(INDEX_FILE) as f:
+        index = json.load(f)
+    found = [(name, signals[signal]) for name, signals in sorted(index.items())
+             if signal in signals and config in (None, name)]
+    if not found:
+        print(f"No HAL signal named {signal}" + (f" in {config}" if config else ""))
+        return 1
+    for name, entry in found:
+        print(f"[{name}]")
+        for hal_file, pins in entry["hal"].items():
+            print(f"  {hal_file}: {', '.join(pins)}")
+        if not entry["wiring"]:
+            print("  Not found in any wiring diagram")
+        for item in entry["wiring"]:
+            if "cable" in item:
+                color = f" ({item['color']})" if item["color"] else ""
+                print(f"  {item['file']}: {item['cable']} wire {item['wire']}{color}: "
+                      f"{' -> '.join(item['ends'])}")
+            else:
+                print(f"  {item['file']}: {item['connector']} pin {item['pin']}")
+    return 0
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Incremental WireViz build")
+    parser.add_argument("command", nargs="*", help="'which <signal>' to look up a HAL signal")
+    parser.add_argument("-f", dest="formats", action="append",
+                        help="output format (png, svg, pdf, html, tsv or wireviz codes)")
+    parser.add_argument("--jobs", type=int, help="parallel renders (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render everything")
+    parser.add_argument("--config", help="limit 'which' to one config (e.g. ethercat-rpi-test)")
+    args = parser.parse_args(argv)
+
+    if args.command:
+        if args.command[0] != "which" or len(args.command) != 2:
+            parser.error("usage: build.py which <signal>")
+        return which(args.command[1], args.config)
+
+    formats = DEFAULT_FORMATS
+    if args.formats:
+        formats = "".join(FORMAT_NAMES.get(name, name) for name in args.formats)
+    failures = build(formats, args.jobs, args.force)
+    write_index(build_index())
+    print(f"HAL index written to {os.path.basename(INDEX_FILE)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
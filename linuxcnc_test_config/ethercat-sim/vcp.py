@@ -5,6 +5,11 @@
 from PyQt5.QtCore import Qt, QTimer
 import linuxcnc
 import sys
+import os
+
+# Modules shared between the configs (readout widget)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from smooth_readout import SmoothReadout
 
 # Create command and stat channels
 STAT = linuxcnc.stat()
@@ -25,10 +30,14 @@ class HandlerClass:
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_position)
         self.timer.start(250)  # Update every 250ms (slower to reduce load)
+        self.readout = None
 
     def initialized__(self):
         print("Handler initialized, connecting buttons...")
 
+        # Position display runs smoothly between the 250ms polls
+        self.readout = SmoothReadout(self.w.positionDisplay)
+
         # Connect buttons - use lambda to ensure we capture the event
         self.w.enableButton.clicked.connect(self.enable_clicked)
         self.w.stopButton.clicked.connect(self.stop_clicked)
@@ -160,10 +169,10 @@ class HandlerClass:
                 if STAT.homed[0]:
                     print("SUCCESS! Joint 0 is now homed!")
                     # Brief display message
-                    self.w.positionDisplay.setText("HOMED: 0.000")
+                    self.readout.show_text("HOMED: 0.000")
                     time.sleep(1)
                     # Then go back to normal display
-                    self.w.positionDisplay.setText("✓ 0.000")
+                    self.readout.show_text("✓ 0.000")
                 else:
                     print("Homing may still be in progress...")
             else:
@@ -251,15 +260,13 @@ class HandlerClass:
 
             # Show position and state
             if STAT.estop:
-                self.w.positionDisplay.setText("E-STOP")
+                self.readout.show_text("E-STOP")
             elif not STAT.enabled:
-                self.w.positionDisplay.setText("DISABLED")
+                self.readout.show_text("DISABLED")
             else:
-                # Show homed status with position
-                if STAT.homed[0]:
-                    self.w.positionDisplay.setText(f"✓ {pos:.3f}")
-                else:
-                    self.w.positionDisplay.setText(f"? {pos:.3f}")
+                # Show homed status with position (extrapolated between polls)
+                self.readout.set_format("✓ {:.3f}" if STAT.homed[0] else "? {:.3f}")
+                self.readout.set_sample(pos, STAT.joint[0]['velocity'])
 
             # Keep button state in sync
             if STAT.enabled and not self.w.enableButton.isChecked():
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Smooth position readout (DRO) for the panels
+Extrapolates between STAT polls so the numbers run smoothly during jogs
+
+The readout drives an existing QLineEdit/QLabel, so the widget keeps its
+stylesheet and place in the layout. While the axis moves, a display-rate
+timer redraws the extrapolated position; the text is only set when the
+formatted value changes. Once the axis stops (or samples stop arriving)
+the timer is stopped and the readout costs nothing.
+"""
+
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+# Display refresh interval while moving (ms), about 60 Hz
+FRAME_INTERVAL = 16
+
+# Never extrapolate further than this past the last sample (seconds);
+# longer than the slowest poll (250 ms) so motion does not stutter
+MAX_EXTRAPOLATION = 0.3
+
+# Velocities below this (units/s) count as stopped
+VELOCITY_EPSILON = 1e-4
+
+
+class SmoothReadout(QObject):
+    """Position readout that extrapolates from position/velocity samples"""
+
+    def __init__(self, widget, fmt="{:.3f}", parent=None):
+        """Set up the readout
+
+        Args:
+            widget: Widget with setText() to drive
+            fmt: Format string for the position, e.g. '{:.3f}"   Z Axis'
+        """
+        super().__init__(parent)
+        self.widget = widget
+        self.fmt = fmt
+        self.position = None
+        self.velocity = 0.0
+        self.sample_time = 0.0
+        self.text = None
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(FRAME_INTERVAL)
+        self.timer.timeout.connect(self.tick)
+
+    def set_format(self, fmt):
+        if fmt != self.fmt:
+            self.fmt = fmt
+            self.show(self.estimate(time.monotonic()))
+
+    def set_sample(self, position, velocity=None):
+        """Feed the latest polled position
+
+        Args:
+            position: Axis position from STAT
+            velocity: Axis velocity in units/s; estimated from the previous
+                sample if None
+        """
+        now = time.monotonic()
+        if velocity is None:
+            if self.position is None or now <= self.sample_time:
+                velocity = 0.0
+            else:
+                velocity = (position - self.position) / (now - self.sample_time)
+        self.position = position
+        self.velocity = velocity
+        self.sample_time = now
+        self.show(position)
+        if abs(velocity) > VELOCITY_EPSILON:
+            if not self.timer.isActive():
+                self.timer.start()
+        else:
+            self.timer.stop()
+
+    def show_text(self, text):
+        """Show a fixed message (E-STOP etc.) instead of a position"""
+        self.timer.stop()
+        self.position = None
+        self.set_text(text)
+
+    def estimate(self, now):
+        """Extrapolated position at time now"""
+        if self.position is None:
+            return None
+        elapsed = min(now - self.sample_time, MAX_EXTRAPOLATION)
+        return self.position + self.velocity * elapsed
+
+    def tick(self):
+        now = time.monotonic()
+        self.show(self.estimate(now))
+        if now - self.sample_time >= MAX_EXTRAPOLATION:
+            # No fresh samples (tab hidden, poll stalled): go quiet
+            self.timer.stop()
+
+    def show(self, position):
+        if position is not None:
+            self.set_text(self.fmt.format(position))
+
+    def set_text(self, text):
+        # Repaint only when the visible text changes
+        if text != self.text:
+            self.text = text
+            self.widget.setText(text)
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Config Updater for John Sawnders
+Delta updates for linuxcnc_test_config (INI, HAL, .ui, handlers, subroutines)
+
+Files are split into content-defined chunks named by their SHA-256. A
+published update is a manifest (file -> chunk list) plus a chunk store;
+the saw only downloads chunks it does not already have, assembles the new
+tree in a side directory and switches a `current` symlink atomically.
+
+Layout on the saw (ROOT):
+    ROOT/current -> releases/<id>     LinuxCNC runs from here
+    ROOT/releases/<id>/               one complete config tree per release
+    ROOT/chunks/                      local chunk cache
+
+Usage:
+    python3 config_update.py publish <config_dir> <out_dir>
+    python3 config_update.py stage --root ROOT --source <dir or http url>
+    python3 config_update.py apply --root ROOT
+    python3 config_update.py rollback --root ROOT
+"""
+
+import argparse
+import configparser
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import urllib.request
+import zlib
+
+# Chunk boundaries fall on line ends so edits only touch nearby chunks
+CHUNK_MIN = 2048
+CHUNK_MAX = 65536
+BOUNDARY_MASK = 0x1f  # roughly one boundary every 32 lines past CHUNK_MIN
+
+MANIFEST_NAME = "manifest.json"
+
+# Runtime state that belongs to the machine, never to an update; apply()
+# carries these over from the running release
+RUNTIME_PATTERNS = ("*.var", "*.var.bak", "job_queue.json", "settings.json", "maintenance.json",
+                    "temp_*.ngc")
+
+# Everything left out of a published release
+EXCLUDE_PATTERNS = RUNTIME_PATTERNS + ("*.tmp", "__pycache__", "*.pyc", ".git")
+
+# Manifest ids and chunk names from a source must look like this
+RELEASE_ID = re.compile(r"[0-9a-f]{16}")
+CHUNK_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+def chunk_data(data):
+    """Split bytes into content-defined chunks"""
+    start = 0
+    pos = 0
+    length = len(data)
+    while pos < length:
+        end = data.find(b"\n", pos)
+        end = length if end < 0 else end + 1
+        size = end - start
+        line = data[pos:end]
+        pos = end
+        if size >= CHUNK_MAX or (size >= CHUNK_MIN and zlib.crc32(line) & BOUNDARY_MASK == 0):
+            # Very long lines (or binary data) are cut at CHUNK_MAX
+            while end - start > CHUNK_MAX:
+                yield data[start:start + CHUNK_MAX]
+                start += CHUNK_MAX
+            yield data[start:end]
+            start = end
+    if start < length:
+        yield data[start:]
+
+
+def chunk_hash(chunk):
+    """Content address of a chunk"""
+    return hashlib.sha256(chunk).hexdigest()
+
+
+def is_excluded(name):
+    """True for runtime files that are not part of an update"""
+    return any(fnmatch.fnmatch(name, pattern) for pattern in EXCLUDE_PATTERNS)
+
+
+def is_runtime(name):
+    """True for machine state that must survive an update"""
+    return any(fnmatch.fnmatch(name, pattern) for pattern in RUNTIME_PATTERNS)
+
+
+def validate_manifest(manifest):
+    """Reject manifests that could write outside the release directory
+
+    Sources are not authenticated, so the id, every file path and every
+    chunk name are checked before anything touches the disk.
+
+    Raises ValueError on the first bad entry.
+    """
+    release_id = manifest.get("id")
+    if not isinstance(release_id, str) or not RELEASE_ID.fullmatch(release_id):
+        raise ValueError(f"bad release id {release_id!r}")
+    files = manifest.get("files")
+    if not isinstance(files, dict):
+        raise ValueError("manifest has no file list")
+    for rel_path, entry in files.items():
+        parts = rel_path.split("/")
+        if (not rel_path or rel_path.startswith("/") or "\\" in rel_path or ":" in parts[0]
+                or any(part in ("", ".", "..") for part in parts)):
+            raise ValueError(f"bad file path {rel_path!r}")
+        if is_excluded(parts[-1]):
+            raise ValueError(f"{rel_path} is machine runtime state")
+        for digest in entry.get("chunks", ()):
+            if not isinstance(digest, str) or not CHUNK_DIGEST.fullmatch(digest):
+                raise ValueError(f"bad chunk name in {rel_path}")
+
+
+class ChunkStore:
+    """Directory of chunks named by hash (chunks/ab/abcd...)"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.chunk_path(digest))
+
+    def get(self, digest):
+        with open(self.chunk_path(digest), "rb") as f:
+            return f.read()
+
+    def put(self, chunk, digest=None):
+        """Store a chunk, returning its hash"""
+        digest = digest or chunk_hash(chunk)
+        path = self.chunk_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(chunk)
+            os.replace(tmp_path, path)
+        return digest
+
+
+def build_manifest(config_dir, store=None):
+    """Hash every file under config_dir into a manifest
+
+    If store is given, chunks are written to it as well.
+    """
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(config_dir):
+        dirnames[:] = sorted(d for d in dirnames if not is_excluded(d))
+        for name in sorted(filenames):
+            if is_excluded(name):
+                continue
+            path = os.path.join(dirpath, name)
+            rel_path = os.path.relpath(path, config_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                data = f.read()
+            chunks = []
+            for chunk in chunk_data(data):
+                digest = chunk_hash(chunk)
+                if store is not None:
+                    store.put(chunk, digest)
+                chunks.append(digest)
+            files[rel_path] = {
+                "size": len(data),
+                "mode": os.stat(path).st_mode & 0o777,
+                "chunks": chunks,
+            }
+    body = json.dumps(files, sort_keys=True).encode()
+    return {"id": hashlib.sha256(body).hexdigest()[:16], "files": files}
+
+
+def publish(config_dir, out_dir):
+    """Write manifest and chunk store for config_dir into out_dir"""
+    manifest = build_manifest(config_dir, ChunkStore(os.path.join(out_dir, "chunks")))
+    tmp_path = os.path.join(out_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_NAME))
+    return manifest
+
+
+class DirectorySource:
+    """Update source on a local or mounted directory (USB stick, NFS share)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.store = ChunkStore(os.path.join(path, "chunks"))
+
+    def manifest(self):
+        with open(os.path.join(self.path, MANIFEST_NAME)) as f:
+            return json.load(f)
+
+    def chunk(self, digest):
+        return self.store.get(digest)
+
+
+class HTTPSource:
+    """Update source on a plain file server (same layout as publish output)"""
+
+    def __init__(self, url, timeout=30.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def fetch(self, path):
+        with urllib.request.urlopen(f"{self.url}/{path}", timeout=self.timeout) as response:
+            return response.read()
+
+    def manifest(self):
+        return json.loads(self.fetch(MANIFEST_NAME))
+
+    def chunk(self, digest):
+        return self.fetch(f"chunks/{digest[:2]}/{digest}")
+
+
+def read_update_config(ini_path):
+    """Return (SOURCE, ROOT) from the [UPDATE] section of an INI, or Nones"""
+    parser = configparser.ConfigParser(strict=False, interpolation=None,
+                                       inline_comment_prefixes=("#", ";"))
+    parser.read(ini_path)
+    source = parser.get("UPDATE", "SOURCE", fallback="").strip() or None
+    root = parser.get("UPDATE", "ROOT", fallback="").strip() or None
+    if root:
+        root = os.path.join(os.path.dirname(os.path.abspath(ini_path)), os.path.expanduser(root))
+    return source, root
+
+
+def open_source(location):
+    """Pick a source type from a path or URL"""
+    if location.startswith(("http://", "https://")):
+        return HTTPSource(location)
+    return DirectorySource(location)
+
+
+class Updater:
+    """Stages releases under ROOT and switches between them"""
+
+    def __init__(self, root):
+        self.root = root
+        self.releases = os.path.join(root, "releases")
+        self.current_link = os.path.join(root, "current")
+        self.cache = ChunkStore(os.path.join(root, "chunks"))
+        os.makedirs(self.releases, exist_ok=True)
+
+    def read_marker(self, name):
+        """Read a release id kept in a small file under ROOT"""
+        try:
+            with open(os.path.join(self.root, name)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def write_marker(self, name, release_id):
+        path = os.path.join(self.root, name)
+        with open(path + ".tmp", "w") as f:
+            f.write(release_id or "")
+        os.replace(path + ".tmp", path)
+
+    @property
+    def staged(self):
+        """Release id waiting to be applied, or None"""
+        staged = self.read_marker("staged")
+        if staged and os.path.isdir(os.path.join(self.releases, staged)):
+            return staged
+        return None
+
+    def current_id(self):
+        """Release id that `current` points to, or None"""
+        if not os.path.islink(self.current_link):
+            return None
+        return os.path.basename(os.readlink(self.current_link))
+
+    def stage(self, source):
+        """Download missing chunks and assemble the new release
+
+        Safe to run while a job is cutting: nothing under `current` is
+        touched. Returns a dict of transfer stats, or None if already
+        up to date.
+        """
+        manifest = source.manifest()
+        validate_manifest(manifest)
+        release_id = manifest["id"]
+        release_dir = os.path.join(self.releases, release_id)
+        if release_id == self.current_id():
+            return None
+
+        # Chunks from the running release are already on this machine
+        current = self.current_id()
+        if current and not os.path.isdir(release_dir):
+            build_manifest(os.path.join(self.releases, current), self.cache)
+
+        stats = {"id": release_id, "chunks_fetched": 0, "bytes_fetched": 0,
+                 "chunks_reused": 0}
+        if not os.path.isdir(release_dir):
+            for entry in manifest["files"].values():
+                for digest in entry["chunks"]:
+                    if self.cache.has(digest):
+                        stats["chunks_reused"] += 1
+                        continue
+                    chunk = source.chunk(digest)
+                    if chunk_hash(chunk) != digest:
+                        raise ValueError(f"chunk {digest} failed verification")
+                    self.cache.put(chunk, digest)
+                    stats["chunks_fetched"] += 1
+                    stats["bytes_fetched"] += len(chunk)
+            self.assemble(manifest, release_dir)
+
+        self.write_marker("staged", release_id)
+        return stats
+
+    def assemble(self, manifest, release_dir):
+        """Write the release tree from cached chunks, then rename into place"""
+        validate_manifest(manifest)
+        tmp_dir = release_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        base = os.path.realpath(tmp_dir)
+        for rel_path, entry in manifest["files"].items():
+            path = os.path.join(tmp_dir, *rel_path.split("/"))
+            if os.path.commonpath([base, os.path.realpath(path)]) != base:
+                raise ValueError(f"{rel_path} resolves outside the release")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                for digest in entry["chunks"]:
+                    f.write(self.cache.get(digest))
+            if os.path.getsize(path) != entry["size"]:
+                raise ValueError(f"{rel_path} size mismatch after assembly")
+            os.chmod(path, entry["mode"] & 0o777)
+        os.replace(tmp_dir, release_dir)
+
+    def switch(self, release_id):
+        """Point `current` at a release in one rename"""
+        tmp_link = self.current_link + ".tmp"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.join("releases", release_id), tmp_link)
+        os.replace(tmp_link, self.current_link)
+
+    def apply(self):
+        """Switch to the staged release (call only between jobs)
+
+        The previous release is kept for rollback; older ones are removed.
+        """
+        staged = self.staged
+        if not staged:
+            return False
+        previous = self.current_id()
+        if previous:
+            self.carry_runtime(os.path.join(self.releases, previous),
+                               os.path.join(self.releases, staged))
+        self.switch(staged)
+        self.write_marker("staged", None)
+        self.write_marker("previous", previous)
+        keep = {staged, previous}
+        for name in os.listdir(self.releases):
+            if name not in keep and not name.endswith(".tmp"):
+                shutil.rmtree(os.path.join(self.releases, name), ignore_errors=True)
+        return True
+
+    def carry_runtime(self, old_dir, new_dir):
+        """Copy queue, settings and parameter files into the new release"""
+        for dirpath, dirnames, filenames in os.walk(old_dir):
+            dirnames[:] = [d for d in dirnames if not is_excluded(d)]
+            for name in filenames:
+                if not is_runtime(name):
+                    continue
+                path = os.path.join(dirpath, name)
+                target = os.path.join(new_dir, os.path.relpath(path, old_dir))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(path, target + ".tmp")
+                os.replace(target + ".tmp", target)
+
+    def rollback(self):
+        """Switch back to the release that was current before the last apply"""
+        previous = self.read_marker("previous")
+        if not previous or not os.path.isdir(os.path.join(self.releases, previous)):
+            return False
+        current = self.current_id()
+        if current:
+            self.carry_runtime(os.path.join(self.releases, current),
+                               os.path.join(self.releases, previous))
+        self.switch(previous)
+        self.write_marker("previous", current)
+        return True
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Delta updates for LinuxCNC configs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("publish", help="build manifest and chunks for a config tree")
+    p.add_argument("config_dir")
+    p.add_argument("out_dir")
+    for name in ("stage", "apply", "rollback", "status"):
+        p = sub.add_parser(name)
+        p.add_argument("--root", required=True, help="update root on the saw")
+        if name == "stage":
+            p.add_argument("--source", required=True, help="directory or http(s) URL")
+    args = parser.parse_args(argv)
+
+    if args.command == "publish":
+        manifest = publish(args.config_dir, args.out_dir)
+        print(f"Published release {manifest['id']} ({len(manifest['files'])} files)")
+        return 0
+
+    updater = Updater(args.root)
+    if args.command == "stage":
+        stats = updater.stage(open_source(args.source))
+        if stats is None:
+            print("Already up to date")
+            return 0
+        print(f"Staged {stats['id']}: fetched {stats['chunks_fetched']} chunks "
+              f"({stats['bytes_fetched']} bytes), reused {stats['chunks_reused']}")
+    elif args.command == "apply":
+        print("Nothing staged" if not updater.apply() else f"Switched to {updater.current_id()}")
+    elif args.command == "rollback":
+        print("No previous release" if not updater.rollback() else f"Rolled back to {updater.current_id()}")
+    else:
+        print(f"Current release: {updater.current_id()}, staged: {updater.staged}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
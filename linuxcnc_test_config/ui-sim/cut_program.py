@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Cut Program Generator for John Sawnders
+Builds the one-cut G-code file for a queued job (DESIGN_SPEC.md template)
+
+Timing parameters come from the settings store. The generator subscribes
+to it, so a changed dwell is used by the next generated program without a
+restart.
+
+The cut timeout is sized from the stock height and the material's
+downfeed rate. Every M66 wait is followed by a #5399 check: after a
+timeout LinuxCNC sets it to -1 and carries on, so the program turns the
+solenoid off and aborts instead.
+"""
+
+import os
+
+from material_db import stock_height
+
+# Settings that appear in the timing block
+TIMING_SETTINGS = ("vice_clamp_dwell", "vice_release_dwell", "head_settle_time",
+                   "spindle_spinup_time")
+
+# Head height for retract between cuts (inches), raised for taller stock
+SAFE_HEIGHT = 6.0
+
+# Shuttle feed rate (units/min)
+SHUTTLE_FEED = 10
+
+# M66 timeouts (seconds)
+HEAD_MOVE_TIMEOUT = 10
+
+# Cut timeout: stock height at the downfeed rate times the margin, plus a
+# fixed allowance for the head falling onto the stock (seconds)
+CUT_TIMEOUT_MARGIN = 1.5
+CUT_TIMEOUT_MIN = 30
+
+# Downfeed rate (in/min) assumed for an unknown material, the slowest in
+# materials.json
+SLOWEST_DOWNFEED_RATE = 0.5
+
+CYCLE_TEMPLATE = """\
+; === CALCULATED VALUES ===
+#<_head_target> = [#<_material_height> + #<_clearance>]
+
+; === MAIN PROGRAM ===
+O<cut_cycle> sub
+
+; Raise head clear of this stock (the last retract may be lower)
+M67 E0 Q#<_safe_height>          ; Safe height
+M64 P1                           ; Lift ON
+M66 P0 L3 Q{head_timeout}                    ; Wait for height
+M65 P1                           ; Lift OFF
+o90 if [#5399 LT 0]              ; M66 timed out
+  (abort, head did not rise to the safe height)
+o90 endif
+
+; Start spindle
+S#<_blade_speed> M3
+G4 P#<_spindle_spinup_time>      ; Spindle spin-up time
+
+; Initial state
+M101                             ; Fixed vice clamp
+M105                             ; Moving vice released
+G4 P#<_vice_clamp_dwell>
+
+; Feed sequence
+G1 Z#<_cut_length> F{feed}          ; Position material
+M104                             ; Clamp moving vice
+G4 P#<_vice_clamp_dwell>
+M102                             ; Release fixed vice pulse
+G4 P#<_vice_release_dwell>
+M103                             ; Fixed vice neutral
+G1 Z0 F{feed}                        ; Shuttle return home
+M101                             ; Re-clamp fixed vice
+G4 P#<_vice_clamp_dwell>
+
+; Head positioning
+M67 E0 Q#<_head_target>          ; Set target height
+M64 P1                           ; Lift solenoid ON
+M66 P0 L3 Q{head_timeout}                    ; Wait for height
+M65 P1                           ; Lift solenoid OFF
+o100 if [#5399 LT 0]             ; M66 timed out
+  M5
+  (abort, head did not reach the target height)
+o100 endif
+G4 P#<_head_settle_time>
+
+; Cutting
+M64 P2                           ; Downfeed ON
+M66 P1 L3 Q#<_cut_timeout>       ; Wait for bottom limit
+M65 P2                           ; Downfeed OFF
+o110 if [#5399 LT 0]             ; M66 timed out
+  M5
+  (abort, cut did not reach the bottom limit)
+o110 endif
+
+; Retract
+M67 E0 Q#<_safe_height>          ; Safe height
+M64 P1                           ; Lift ON
+M66 P0 L3 Q{head_timeout}                    ; Wait for height
+M65 P1                           ; Lift OFF
+o120 if [#5399 LT 0]             ; M66 timed out
+  M5
+  (abort, head did not retract to the safe height)
+o120 endif
+
+O<cut_cycle> endsub
+
+O<cut_cycle> call
+
+; Program end
+M5                               ; Spindle stop
+M30
+"""
+
+
+class CutProgramGenerator:
+    """Generates cut cycle programs from job metadata and settings"""
+
+    def __init__(self, settings, materials=None):
+        """Set up the generator
+
+        Args:
+            settings: Settings store for timing and clearance
+            materials: MaterialDB for downfeed rates; without it every cut
+                is timed at SLOWEST_DOWNFEED_RATE
+        """
+        self.settings = settings
+        self.materials = materials
+        self.cycle = CYCLE_TEMPLATE.format(feed=SHUTTLE_FEED, head_timeout=HEAD_MOVE_TIMEOUT)
+        self.timing_block = None
+        self.build_timing_block()
+        settings.subscribe(self.on_setting_changed)
+
+    def build_timing_block(self):
+        """Rebuild the cached timing parameter block"""
+        lines = ["; === TIMING PARAMETERS (from settings) ==="]
+        for name in TIMING_SETTINGS:
+            lines.append(f"#<_{name}> = {getattr(self.settings, name):.3f}")
+        self.timing_block = "\n".join(lines) + "\n\n"
+
+    def on_setting_changed(self, name, value):
+        """Settings subscriber"""
+        if name in TIMING_SETTINGS:
+            self.build_timing_block()
+
+    def cut_timeout(self, metadata, height):
+        """Seconds to allow the downfeed to reach the bottom limit"""
+        rate = SLOWEST_DOWNFEED_RATE
+        if self.materials is not None:
+            self.materials.check_reload()
+            recommendation = self.materials.recommend(metadata.get("material_type") or "",
+                                                      metadata["material_shape"])
+            if recommendation and recommendation["downfeed_rate"] > 0:
+                rate = recommendation["downfeed_rate"]
+        return height / rate * 60.0 * CUT_TIMEOUT_MARGIN + CUT_TIMEOUT_MIN
+
+    def generate(self, job):
+        """Return the G-code text for one cut of a job"""
+        metadata = job["metadata"]
+        height = stock_height(metadata["material_shape"], metadata["stock_dimensions"])
+        clearance = self.settings.clearance
+        header = (
+            f"; Job {job.get('id')} - {metadata.get('material_type', '')} "
+            f"{metadata['material_shape']} - {metadata['cut_length']} cut\n"
+            "; === PARAMETERS ===\n"
+            f"#<_material_height> = {height:.4f}\n"
+            f"#<_cut_length> = {metadata['cut_length']:.4f}\n"
+            f"#<_blade_speed> = {metadata.get('blade_speed', 85)}\n"
+            f"#<_clearance> = {clearance:.4f}\n"
+            f"#<_safe_height> = {max(SAFE_HEIGHT, height + clearance):.4f}\n"
+            f"#<_cut_timeout> = {self.cut_timeout(metadata, height):.1f}\n\n"
+        )
+        return header + self.timing_block + self.cycle
+
+    def write(self, job, directory):
+        """Write the program to directory/<nc_file>, returns the path
+
+        Raises ValueError if nc_file is not a plain .ngc file name.
+        """
+        name = job["nc_file"]
+        if (not isinstance(name, str) or os.path.basename(name) != name
+                or "\\" in name or not name.endswith(".ngc")):
+            raise ValueError(f"bad program file name {name!r}")
+        path = os.path.join(directory, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.generate(job))
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Cut List Importer for John Sawnders
+Streams CSV/TSV cut lists (ERP exports) into job_queue.json
+
+Usage:
+    python3 cutlist_import.py cutlist.csv [--queue job_queue.json] [--ini ui_sim.ini]
+"""
+
+import argparse
+import configparser
+import csv
+import math
+import os
+import sys
+from collections import namedtuple
+
+from job_queue import JobQueue, QUEUE_FILE
+from material_db import MaterialDB, SHAPE_DIMENSIONS
+
+# Default machine config for limits
+INI_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ui_sim.ini")
+
+# Shuttle is the Z axis (see planning/DESIGN_SPEC.md)
+SHUTTLE_AXIS = "Z"
+
+# Used when neither the file nor the material database gives a speed
+DEFAULT_BLADE_SPEED = 85
+
+# Shape names as they show up in ERP exports
+SHAPE_ALIASES = {
+    "rect": "rectangular",
+    "rectangle": "rectangular",
+    "flat": "rectangular",
+    "pipe": "tube",
+    "hexagon": "hex",
+    "bar": "round",
+}
+
+# Accepted header names for each field (compared lowercase, spaces -> _)
+COLUMN_ALIASES = {
+    "material_type": ("material_type", "material", "grade"),
+    "material_shape": ("material_shape", "shape", "profile"),
+    "cut_length": ("cut_length", "length", "cut_len"),
+    "total_qty": ("total_qty", "qty", "quantity"),
+    "blade_speed": ("blade_speed", "speed"),
+    "customer": ("customer", "cust"),
+    "notes": ("notes", "note", "comment"),
+    "size": ("size", "side"),
+    "diameter": ("diameter", "dia"),
+    "width": ("width",),
+    "height": ("height",),
+    "flats": ("flats", "across_flats"),
+    "od": ("od", "outside_diameter"),
+    "wall": ("wall", "wall_thickness"),
+    "leg1": ("leg1",),
+    "leg2": ("leg2",),
+    "thickness": ("thickness",),
+}
+
+RowError = namedtuple("RowError", "line message")
+
+
+class ImportResult:
+    """Summary of one import run"""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_merged = 0
+        self.jobs = []
+        self.errors = []
+
+    def report(self):
+        """Return a printable summary with one line per bad row"""
+        lines = [f"{self.rows_read} rows read, {len(self.jobs)} jobs queued, "
+                 f"{self.rows_merged} duplicate rows merged, {len(self.errors)} errors"]
+        for error in self.errors:
+            lines.append(f"  line {error.line}: {error.message}")
+        return "\n".join(lines)
+
+
+def read_cut_limit(ini_path=INI_FILE, axis=SHUTTLE_AXIS):
+    """Return the longest cut the shuttle can feed (MAX_LIMIT of the axis)"""
+    parser = configparser.ConfigParser(strict=False, interpolation=None,
+                                       inline_comment_prefixes=("#", ";"))
+    parser.read(ini_path)
+    return parser.getfloat(f"AXIS_{axis}", "MAX_LIMIT")
+
+
+def map_columns(header):
+    """Map CSV header positions to job fields"""
+    lookup = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            lookup[alias] = field
+    columns = {}
+    for position, name in enumerate(header):
+        key = name.strip().lower().replace(" ", "_").replace("-", "_")
+        if key in lookup and lookup[key] not in columns:
+            columns[lookup[key]] = position
+    return columns
+
+
+def sniff_dialect(f, path):
+    """Pick CSV or TSV from the extension, falling back to sniffing"""
+    if path.lower().endswith((".tsv", ".tab")):
+        return csv.excel_tab
+    sample = f.read(4096)
+    f.seek(0)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",\t;")
+    except csv.Error:
+        return csv.excel
+
+
+def parse_positive(value, name):
+    """Parse a positive float, raising ValueError with a readable message"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} '{value}' is not a number")
+    if not math.isfinite(number):
+        raise ValueError(f"{name} '{value}' is not a finite number")
+    if number <= 0:
+        raise ValueError(f"{name} must be greater than 0")
+    return number
+
+
+def parse_row(row, columns, cut_limit, materials=None):
+    """Turn one CSV row into (merge key, metadata, qty)
+
+    Missing blade speeds are taken from the material database if given.
+
+    Raises ValueError describing the first problem found.
+    """
+    def get(field):
+        position = columns.get(field)
+        if position is None or position >= len(row):
+            return ""
+        return row[position].strip()
+
+    shape = get("material_shape").lower()
+    shape = SHAPE_ALIASES.get(shape, shape)
+    if shape not in SHAPE_DIMENSIONS:
+        raise ValueError(f"unknown material shape '{get('material_shape')}'")
+
+    dimensions = {"type": shape}
+    for field in SHAPE_DIMENSIONS[shape]:
+        value = get(field)
+        # Single-dimension shapes often export a generic "size" column
+        if not value and len(SHAPE_DIMENSIONS[shape]) == 1:
+            value = get("size")
+        dimensions[field] = parse_positive(value, field)
+
+    cut_length = parse_positive(get("cut_length"), "cut_length")
+    if cut_length > cut_limit:
+        raise ValueError(f"cut_length {cut_length} exceeds machine limit {cut_limit}")
+
+    qty_text = get("total_qty") or "1"
+    try:
+        qty_value = float(qty_text)
+        qty = int(qty_value)
+    except (ValueError, OverflowError):
+        raise ValueError(f"total_qty '{qty_text}' is not a whole number")
+    if qty != qty_value:
+        raise ValueError(f"total_qty '{qty_text}' is not a whole number")
+    if qty <= 0:
+        raise ValueError("total_qty must be greater than 0")
+
+    material_type = get("material_type")
+    speed_text = get("blade_speed")
+    blade_speed = DEFAULT_BLADE_SPEED
+    if materials is not None and material_type:
+        recommendation = materials.recommend(material_type, shape)
+        if recommendation:
+            material_type = recommendation["material_type"]
+            if not speed_text:
+                blade_speed = recommendation["blade_speed"]
+    if speed_text:
+        blade_speed = parse_positive(speed_text, "blade_speed")
+        if blade_speed > 100:
+            raise ValueError(f"blade_speed {blade_speed} is over 100%")
+
+    metadata = {
+        "material_type": material_type,
+        "material_shape": shape,
+        "stock_dimensions": dimensions,
+        "cut_length": cut_length,
+        "blade_speed": blade_speed,
+        "customer": get("customer"),
+        "notes": get("notes"),
+    }
+    key = (metadata["material_type"].lower(), shape,
+           tuple(sorted(dimensions.items())), cut_length, blade_speed,
+           metadata["customer"].lower())
+    return key, metadata, qty
+
+
+def import_cutlist(path, queue, cut_limit, strict=False, materials=None):
+    """Stream a cut list into the queue
+
+    Rows are read one at a time; only one entry per distinct job is kept,
+    so duplicate lines cost nothing but a quantity update. All jobs are
+    added with a single queue save.
+
+    Args:
+        path: CSV/TSV file
+        queue: JobQueue to insert into
+        cut_limit: Longest allowed cut_length
+        strict: If True, import nothing when any row has an error
+        materials: Optional MaterialDB for grade names and blade speeds
+
+    Returns:
+        ImportResult
+    """
+    result = ImportResult()
+    merged = {}
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f, sniff_dialect(f, path))
+        header = next(reader, None)
+        if header is None:
+            result.errors.append(RowError(1, "file is empty"))
+            return result
+        columns = map_columns(header)
+        missing = [field for field in ("material_shape", "cut_length") if field not in columns]
+        if missing:
+            result.errors.append(RowError(1, f"missing column(s): {', '.join(missing)}"))
+            return result
+
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            result.rows_read += 1
+            try:
+                key, metadata, qty = parse_row(row, columns, cut_limit, materials)
+            except ValueError as e:
+                result.errors.append(RowError(reader.line_num, str(e)))
+                continue
+            if key in merged:
+                merged[key][1] += qty
+                result.rows_merged += 1
+            else:
+                merged[key] = [metadata, qty]
+
+    if strict and result.errors:
+        return result
+
+    jobs = [queue.make_job(metadata, qty) for metadata, qty in merged.values()]
+    if jobs:
+        result.jobs = queue.add_jobs(jobs)
+    return result
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Import a cut list into job_queue.json")
+    parser.add_argument("cutlist", help="CSV or TSV cut list")
+    parser.add_argument("--queue", default=QUEUE_FILE, help="job_queue.json to update")
+    parser.add_argument("--ini", default=INI_FILE, help="LinuxCNC INI with machine limits")
+    parser.add_argument("--strict", action="store_true",
+                        help="import nothing if any row has an error")
+    args = parser.parse_args(argv)
+
+    result = import_cutlist(args.cutlist, JobQueue(args.queue), read_cut_limit(args.ini),
+                            strict=args.strict, materials=MaterialDB())
+    print(result.report())
+    return 1 if result.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+Multi-Saw Dispatcher for John Sawnders
+One shared job pool (job_queue.json) feeding several saws
+
+Saws pull work instead of being pushed: each claim reports the stock
+loaded, the blade installed and the time left on the saw's current work.
+The dispatcher hands out a lease for a batch of pieces, preferring jobs
+that match the loaded stock and leaving jobs whose stock is loaded on
+another saw to that saw. Leases must be renewed; a saw that stops
+heartbeating (crash, E-stop, power loss) has its pieces returned to the
+pool.
+
+Usage:
+    python3 dispatch.py serve [--queue job_queue.json] [--port 8766]
+    python3 dispatch.py simulate --saws 3 [--speed 100]   (on a scratch copy)
+    python3 dispatch.py saw --server http://host:8766 --saw-id saw2
+"""
+
+import argparse
+import configparser
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from job_queue import JobQueue, QUEUE_FILE, STATUS_PENDING, STATUS_RUNNING
+from material_db import MaterialDB, stock_height
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+
+# Seconds a lease stays valid without a heartbeat
+LEASE_TIMEOUT = 120.0
+
+# Aim for leases of about this much cutting time (seconds)
+LEASE_TARGET_TIME = 600.0
+
+# A saw with more than this much work left gets no new lease yet (seconds)
+PREFETCH_WINDOW = 60.0
+
+# Fixed part of a cut cycle: shuttle, vices, head moves (seconds)
+CYCLE_OVERHEAD = 25.0
+
+# Used when a material is not in the database (inches per minute)
+DEFAULT_DOWNFEED_RATE = 1.0
+
+# Seconds between heartbeats and claims from a saw's handler
+AGENT_INTERVAL = 10.0
+
+
+def stock_key(metadata):
+    """Identify a stock bar: material, shape and dimensions"""
+    if not metadata:
+        return None
+    dimensions = metadata.get("stock_dimensions") or {}
+    return ((metadata.get("material_type") or "").lower(),
+            metadata.get("material_shape"),
+            tuple(sorted(dimensions.items())))
+
+
+class Lease:
+    """Pieces of one job reserved for one saw"""
+
+    def __init__(self, lease_id, saw_id, job_id, pieces, expires):
+        self.lease_id = lease_id
+        self.saw_id = saw_id
+        self.job_id = job_id
+        self.pieces = pieces
+        self.expires = expires
+
+    def as_dict(self, job=None):
+        result = {"lease_id": self.lease_id, "saw_id": self.saw_id,
+                  "job_id": self.job_id, "pieces": self.pieces}
+        if job is not None:
+            result["job"] = job
+        return result
+
+
+class Dispatcher:
+    """Shared job pool with leases"""
+
+    def __init__(self, queue, materials=None, clock=time.monotonic):
+        """Set up the dispatcher
+
+        Args:
+            queue: JobQueue holding the shared pool
+            materials: MaterialDB for cut time estimates (optional)
+            clock: Time source, replaceable for simulation
+        """
+        self.queue = queue
+        self.materials = materials
+        self.clock = clock
+        self.leases = {}
+        self.saws = {}
+        self.lease_count = 0
+
+    def piece_time(self, job):
+        """Estimated seconds for one piece of a job"""
+        metadata = job["metadata"]
+        rate = DEFAULT_DOWNFEED_RATE
+        if self.materials is not None:
+            recommendation = self.materials.recommend(metadata.get("material_type") or "",
+                                                      metadata.get("material_shape"))
+            if recommendation:
+                rate = recommendation["downfeed_rate"]
+        try:
+            height = stock_height(metadata["material_shape"], metadata["stock_dimensions"])
+        except (KeyError, TypeError):
+            height = 0.0
+        return CYCLE_OVERHEAD + height / rate * 60.0
+
+    def leased_pieces(self, job_id):
+        return sum(lease.pieces for lease in self.leases.values() if lease.job_id == job_id)
+
+    def expire_leases(self):
+        """Return pieces from leases that were not renewed"""
+        now = self.clock()
+        for lease_id in [lease_id for lease_id, lease in self.leases.items()
+                         if lease.expires < now]:
+            lease = self.leases.pop(lease_id)
+            print(f"Lease {lease_id} on {lease.job_id} expired, "
+                  f"{lease.pieces} pieces returned to pool")
+
+    def claim(self, saw_id, stock=None, blade=None, remaining_time=0.0):
+        """Lease the best next work for a saw
+
+        Args:
+            saw_id: Name of the saw
+            stock: Metadata-like dict of the bar loaded (material_type,
+                material_shape, stock_dimensions), or None
+            blade: Blade installed; jobs with metadata["blade"] need a match
+            remaining_time: Seconds of work the saw still has
+
+        Returns:
+            Lease dict with the job, or None if nothing suitable (or the
+            saw still has plenty of work)
+        """
+        with self.queue.lock:
+            now = self.clock()
+            self.expire_leases()
+            self.saws[saw_id] = {"stock": stock_key(stock), "blade": blade,
+                                 "remaining_time": remaining_time, "seen": now}
+            if remaining_time > PREFETCH_WINDOW:
+                return None
+
+            own_stock = stock_key(stock)
+            other_stock = {saw["stock"] for other_id, saw in self.saws.items()
+                           if other_id != saw_id and saw["stock"] is not None
+                           and now - saw["seen"] < LEASE_TIMEOUT}
+            best = None
+            for job in self.queue.jobs:
+                if job["status"] not in (STATUS_PENDING, STATUS_RUNNING):
+                    continue
+                free = job["total_qty"] - job["completed_qty"] - self.leased_pieces(job["id"])
+                if free <= 0:
+                    continue
+                required_blade = job["metadata"].get("blade")
+                if required_blade and required_blade != blade:
+                    continue
+                key = stock_key(job["metadata"])
+                rank = (key != own_stock, key in other_stock, job["index"])
+                if best is None or rank < best[0]:
+                    best = (rank, job, free)
+            if best is None:
+                return None
+
+            _, job, free = best
+            pieces = max(1, min(free, int(LEASE_TARGET_TIME / self.piece_time(job))))
+            self.lease_count += 1
+            lease = Lease(f"{saw_id}-{self.lease_count}", saw_id, job["id"], pieces,
+                          now + LEASE_TIMEOUT)
+            self.leases[lease.lease_id] = lease
+            result = lease.as_dict(job)
+            result["piece_time"] = self.piece_time(job)
+            return result
+
+    def get_lease(self, lease_id):
+        lease = self.leases.get(lease_id)
+        if lease is None:
+            raise KeyError(f"unknown or expired lease {lease_id}")
+        return lease
+
+    def heartbeat(self, lease_id, remaining_time=None):
+        """Renew a lease, returns the new expiry in seconds from now"""
+        with self.queue.lock:
+            lease = self.get_lease(lease_id)
+            lease.expires = self.clock() + LEASE_TIMEOUT
+            if remaining_time is not None and lease.saw_id in self.saws:
+                self.saws[lease.saw_id]["remaining_time"] = remaining_time
+                self.saws[lease.saw_id]["seen"] = self.clock()
+            return LEASE_TIMEOUT
+
+    def complete(self, lease_id, pieces=1):
+        """Record finished pieces against a lease"""
+        if pieces < 1:
+            raise ValueError("pieces must be at least 1")
+        with self.queue.lock:
+            lease = self.get_lease(lease_id)
+            pieces = min(pieces, lease.pieces)
+            for _ in range(pieces):
+                job = self.queue.complete_piece(lease.job_id)
+            lease.pieces -= pieces
+            lease.expires = self.clock() + LEASE_TIMEOUT
+            if lease.pieces <= 0:
+                del self.leases[lease_id]
+            return {"lease_id": lease_id, "pieces_left": lease.pieces,
+                    "job_status": job["status"]}
+
+    def release(self, lease_id):
+        """Give back the unfinished pieces of a lease"""
+        with self.queue.lock:
+            self.leases.pop(lease_id, None)
+
+    def status(self):
+        """Pool and saw overview"""
+        with self.queue.lock:
+            self.expire_leases()
+            now = self.clock()
+            return {
+                "pending_pieces": sum(job["total_qty"] - job["completed_qty"]
+                                      for job in self.queue.pending_jobs()),
+                "leases": [lease.as_dict() for lease in self.leases.values()],
+                "saws": {saw_id: {"remaining_time": saw["remaining_time"],
+                                  "last_seen": round(now - saw["seen"], 1)}
+                         for saw_id, saw in self.saws.items()},
+            }
+
+
+class DispatchServer:
+    """HTTP front end for a Dispatcher
+
+    POST /claim      {"saw_id", "stock", "blade", "remaining_time"} -> lease or null
+    POST /heartbeat  {"lease_id", "remaining_time"}
+    POST /complete   {"lease_id", "pieces"}
+    POST /release    {"lease_id"}
+    GET  /status
+    """
+
+    def __init__(self, dispatcher, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.dispatcher = dispatcher
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name="dispatch", daemon=True)
+        self.thread.start()
+        print(f"Dispatcher listening on {self.url}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def make_handler(self):
+        """Build the request handler class bound to this dispatcher"""
+        dispatcher = self.dispatcher
+        # path -> (required body fields, call); a KeyError from the call
+        # means an unknown lease (404), missing fields are a bad request
+        routes = {
+            "/claim": (("saw_id",), lambda body: {"lease": dispatcher.claim(
+                body["saw_id"], body.get("stock"), body.get("blade"),
+                float(body.get("remaining_time", 0.0)))}),
+            "/heartbeat": (("lease_id",), lambda body: {"timeout": dispatcher.heartbeat(
+                body["lease_id"], body.get("remaining_time"))}),
+            "/complete": (("lease_id",), lambda body: dispatcher.complete(
+                body["lease_id"], int(body.get("pieces", 1)))),
+            "/release": (("lease_id",), lambda body: dispatcher.release(body["lease_id"]) or {}),
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/status":
+                    self.send_json(200, dispatcher.status())
+                else:
+                    self.send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                route = routes.get(self.path.rstrip("/"))
+                if route is None:
+                    self.send_json(404, {"error": "not found"})
+                    return
+                fields, call = route
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                    if not isinstance(body, dict):
+                        raise ValueError("body must be a JSON object")
+                    missing = [field for field in fields if field not in body]
+                    if missing:
+                        raise ValueError(f"missing {', '.join(missing)}")
+                    result = call(body)
+                except KeyError as e:
+                    self.send_json(404, {"error": str(e).strip("'")})
+                    return
+                except (ValueError, TypeError) as e:  # includes JSONDecodeError
+                    self.send_json(400, {"error": str(e)})
+                    return
+                self.send_json(200, result)
+
+        return Handler
+
+
+class DispatchClient:
+    """Client used by each saw's handler"""
+
+    def __init__(self, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", saw_id="saw1", timeout=5.0):
+        self.url = url.rstrip("/")
+        self.saw_id = saw_id
+        self.timeout = timeout
+
+    def post(self, path, body):
+        req = urllib.request.Request(self.url + path, data=json.dumps(body).encode(),
+                                     method="POST",
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def claim(self, stock=None, blade=None, remaining_time=0.0):
+        """Ask for work, returns a lease dict or None"""
+        return self.post("/claim", {"saw_id": self.saw_id, "stock": stock, "blade": blade,
+                                    "remaining_time": remaining_time})["lease"]
+
+    def heartbeat(self, lease_id, remaining_time=None):
+        return self.post("/heartbeat", {"lease_id": lease_id, "remaining_time": remaining_time})
+
+    def complete(self, lease_id, pieces=1):
+        return self.post("/complete", {"lease_id": lease_id, "pieces": pieces})
+
+    def release(self, lease_id):
+        return self.post("/release", {"lease_id": lease_id})
+
+    def status(self):
+        with urllib.request.urlopen(self.url + "/status", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+def read_dispatch_config(ini_path):
+    """Return (SERVER, SAW_ID, BLADE) from the [DISPATCH] section of an INI"""
+    parser = configparser.ConfigParser(strict=False, interpolation=None,
+                                       inline_comment_prefixes=("#", ";"))
+    parser.read(ini_path)
+    server = parser.get("DISPATCH", "SERVER", fallback="").strip() or None
+    saw_id = parser.get("DISPATCH", "SAW_ID", fallback="").strip() or "saw1"
+    blade = parser.get("DISPATCH", "BLADE", fallback="").strip() or None
+    return server, saw_id, blade
+
+
+class SawAgent(threading.Thread):
+    """Background link between one saw's handler and the dispatcher
+
+    Claims work when nothing is leased, renews the lease and reports
+    finished pieces, so the UI thread never waits on the network. The
+    handler picks up new leases with take_new_lease() and reports each
+    finished piece with piece_done().
+    """
+
+    def __init__(self, client, blade=None, interval=AGENT_INTERVAL):
+        super().__init__(name="saw-agent", daemon=True)
+        self.client = client
+        self.blade = blade
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.lease = None
+        self.new_lease = None
+        self.pieces_left = 0
+        self.completed = 0  # finished but not yet reported
+        self.stock = None
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+
+    def take_new_lease(self):
+        """Lease dict claimed since the last call, or None"""
+        with self.lock:
+            lease, self.new_lease = self.new_lease, None
+            return lease
+
+    def piece_done(self):
+        with self.lock:
+            self.completed += 1
+            self.pieces_left -= 1
+        self.wake.set()
+
+    def stop(self):
+        """Stop the agent and give back unfinished pieces"""
+        self.stop_event.set()
+        self.wake.set()
+        self.join()
+        if self.lease is not None:
+            try:
+                self.step()  # report anything finished
+                if self.lease is not None:
+                    self.client.release(self.lease["lease_id"])
+            except (OSError, ValueError) as e:
+                print(f"Lease not released: {e}")
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.step()
+            except (OSError, ValueError) as e:  # URLError is an OSError
+                print(f"Dispatcher unreachable: {e}")
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def step(self):
+        with self.lock:
+            lease, done, left = self.lease, self.completed, self.pieces_left
+        if lease is not None:
+            try:
+                if done:
+                    result = self.client.complete(lease["lease_id"], done)
+                    with self.lock:
+                        self.completed -= done
+                    if result["pieces_left"] <= 0:
+                        lease = None
+                else:
+                    self.client.heartbeat(lease["lease_id"],
+                                          remaining_time=left * lease["piece_time"])
+            except urllib.error.HTTPError as e:
+                if e.code != 404:
+                    raise
+                print(f"Lease {lease['lease_id']} expired, pieces went back to the pool")
+                lease = None
+            if lease is None:
+                with self.lock:
+                    self.lease = None
+                    self.completed = 0
+        if lease is None and not self.stop_event.is_set():
+            claimed = self.client.claim(self.stock, self.blade)
+            if claimed is not None:
+                metadata = claimed["job"]["metadata"]
+                with self.lock:
+                    self.lease = self.new_lease = claimed
+                    self.pieces_left = claimed["pieces"]
+                    self.stock = {key: metadata.get(key) for key in
+                                  ("material_type", "material_shape", "stock_dimensions")}
+
+
+class SimulatedSaw(threading.Thread):
+    """Saw stand-in that claims work and cuts it at an accelerated rate"""
+
+    def __init__(self, client, blade=None, speed=100.0, crash_after=None):
+        """Set up the saw
+
+        Args:
+            client: DispatchClient for this saw
+            blade: Blade installed
+            speed: Simulation speed-up factor
+            crash_after: Stop heartbeating after this many pieces (lease test)
+        """
+        super().__init__(name=client.saw_id, daemon=True)
+        self.client = client
+        self.blade = blade
+        self.speed = speed
+        self.crash_after = crash_after
+        self.stock = None
+        self.pieces = 0
+        self.busy_time = 0.0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            lease = self.client.claim(self.stock, self.blade)
+            if lease is None:
+                if self.stop_event.wait(1.0 / self.speed):
+                    return
+                continue
+            job = lease["job"]
+            self.stock = {key: job["metadata"].get(key) for key in
+                          ("material_type", "material_shape", "stock_dimensions")}
+            piece_time = lease["piece_time"]
+            for left in range(lease["pieces"], 0, -1):
+                if self.crash_after is not None and self.pieces >= self.crash_after:
+                    print(f"{self.name} crashed holding {lease['lease_id']}")
+                    return
+                self.client.heartbeat(lease["lease_id"], remaining_time=left * piece_time)
+                if self.stop_event.wait(piece_time / self.speed):
+                    self.client.release(lease["lease_id"])
+                    return
+                self.client.complete(lease["lease_id"])
+                self.pieces += 1
+                self.busy_time += piece_time
+
+
+def simulate(queue_path, saws, speed):
+    """Run several simulated saws against one dispatcher until the pool is empty
+
+    Works on a scratch copy of the queue; the real job_queue.json is never
+    written.
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="dispatch-sim-")
+    scratch_path = os.path.join(scratch_dir, "job_queue.json")
+    if os.path.exists(queue_path):
+        shutil.copyfile(queue_path, scratch_path)
+    try:
+        run_fleet(JobQueue(scratch_path), saws, speed)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def run_fleet(queue, saws, speed):
+    dispatcher = Dispatcher(queue, MaterialDB())
+    server = DispatchServer(dispatcher, port=0)
+    server.start()
+    fleet = [SimulatedSaw(DispatchClient(server.url, f"saw{n + 1}"), speed=speed)
+             for n in range(saws)]
+    start = time.monotonic()
+    for saw in fleet:
+        saw.start()
+    while dispatcher.status()["pending_pieces"] > 0:
+        time.sleep(0.2)
+    for saw in fleet:
+        saw.stop_event.set()
+        saw.join()
+    server.stop()
+    elapsed = (time.monotonic() - start) * speed
+    for saw in fleet:
+        print(f"{saw.name}: {saw.pieces} pieces, {saw.busy_time / max(elapsed, 1e-9):.0%} busy")
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Multi-saw job dispatcher")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="run the dispatcher")
+    p.add_argument("--queue", default=QUEUE_FILE)
+    p.add_argument("--host", default=DEFAULT_HOST)
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p = sub.add_parser("simulate", help="drain a queue with simulated saws")
+    p.add_argument("--queue", default=QUEUE_FILE)
+    p.add_argument("--saws", type=int, default=3)
+    p.add_argument("--speed", type=float, default=100.0)
+    p = sub.add_parser("saw", help="run one simulated saw against a dispatcher")
+    p.add_argument("--server", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+    p.add_argument("--saw-id", default="saw1")
+    p.add_argument("--blade")
+    p.add_argument("--speed", type=float, default=100.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "simulate":
+        simulate(args.queue, args.saws, args.speed)
+        return 0
+    if args.command == "saw":
+        saw = SimulatedSaw(DispatchClient(args.server, args.saw_id), args.blade, args.speed)
+        saw.start()
+        try:
+            saw.join()
+        except KeyboardInterrupt:
+            saw.stop_event.set()
+            saw.join()
+        return 0
+
+    server = DispatchServer(Dispatcher(JobQueue(args.queue), MaterialDB()), args.host, args.port)
+    server.start()
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped G-code file with a line offset index
+Lets the viewer fetch any line without reading the whole program
+"""
+
+import mmap
+import re
+from array import array
+
+# Bytes indexed per call to index_more (keeps each UI slice short)
+INDEX_CHUNK = 2 * 1024 * 1024
+
+NEWLINE = re.compile(b"\n")
+
+
+class GcodeFile:
+    """Read-only view of a program file, indexed incrementally"""
+
+    def __init__(self, path):
+        """Map the file and index the first chunk
+
+        Args:
+            path: Program file (.ngc)
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.data = b""  # empty file cannot be mapped
+        self.size = len(self.data)
+        # offsets[n] is the byte offset where line n (0-based) starts
+        self.offsets = array("q", [0])
+        self.indexed_to = 0
+        self.index_more()
+
+    @property
+    def complete(self):
+        """True once every line start is known"""
+        return self.indexed_to >= self.size
+
+    @property
+    def line_count(self):
+        """Lines known so far (exact once complete)"""
+        count = len(self.offsets)
+        if self.complete and self.offsets[-1] >= self.size:
+            count -= 1  # file ends with a newline, no partial last line
+        return max(count, 0)
+
+    def index_more(self, max_bytes=INDEX_CHUNK):
+        """Extend the index by up to max_bytes, returns True when complete"""
+        if self.complete:
+            return True
+        end = min(self.indexed_to + max_bytes, self.size)
+        self.offsets.extend(match.end() for match in NEWLINE.finditer(self.data, self.indexed_to, end))
+        self.indexed_to = end
+        return self.complete
+
+    def ensure_line(self, number):
+        """Index far enough to know where line number (0-based) starts"""
+        while number >= len(self.offsets) - 1 and not self.complete:
+            self.index_more()
+
+    def line(self, number):
+        """Text of line number (0-based), '' past the end"""
+        self.ensure_line(number)
+        if number < 0 or number >= self.line_count:
+            return ""
+        start = self.offsets[number]
+        end = self.offsets[number + 1] if number + 1 < len(self.offsets) else self.size
+        return self.data[start:end].rstrip(b"\r\n").decode("utf-8", "replace")
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Virtualized G-code viewer for the Auto tab
+Paints only the visible lines of a memory-mapped program and moves the
+current-line highlight by repainting just the two affected rows
+"""
+
+from PyQt5.QtCore import Qt, QRect, QTimer
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QPainter
+from PyQt5.QtWidgets import QAbstractScrollArea
+
+from gcode_file import GcodeFile
+
+# Colors from the gcodePreview stylesheet
+BACKGROUND_COLOR = QColor("#0a0a0a")
+TEXT_COLOR = QColor("#cecece")
+DIM_COLOR = QColor("#6e6e6e")
+HIGHLIGHT_COLOR = QColor(93, 162, 31, 110)  # #5da21f, translucent
+
+
+class GcodeView(QAbstractScrollArea):
+    """Read-only program view that scales to any file size"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.program = None
+        self.current_line = 0  # 1-based like STAT.motion_line, 0 = none
+        self.follow = True
+
+        font = QFont("Courier New")
+        font.setStyleHint(QFont.Monospace)
+        font.setPixelSize(18)
+        self.setFont(font)
+        metrics = QFontMetrics(font)
+        self.line_height = metrics.height()
+        self.char_width = metrics.horizontalAdvance("0")
+        self.gutter_chars = 5
+
+        self.setStyleSheet("border: 1px solid #2a2a2a; border-radius: 5px;")
+        self.viewport().setAutoFillBackground(False)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+
+        # Index the rest of a large file in short slices between events
+        self.index_timer = QTimer(self)
+        self.index_timer.setInterval(0)
+        self.index_timer.timeout.connect(self.index_step)
+
+    def load(self, path):
+        """Open a program; only the first chunk is indexed up front"""
+        self.close_program()
+        self.program = GcodeFile(path)
+        self.current_line = 0
+        self.gutter_chars = 5
+        self.verticalScrollBar().setValue(0)
+        self.update_scroll_range()
+        if not self.program.complete:
+            self.index_timer.start()
+        self.viewport().update()
+
+    def close_program(self):
+        self.index_timer.stop()
+        if self.program is not None:
+            self.program.close()
+            self.program = None
+
+    def index_step(self):
+        """Index one more chunk, stop when done"""
+        if self.program is None or self.program.index_more():
+            self.index_timer.stop()
+        self.update_scroll_range()
+
+    def visible_rows(self):
+        return max(1, self.viewport().height() // self.line_height)
+
+    def update_scroll_range(self):
+        count = self.program.line_count if self.program else 0
+        gutter = max(5, len(str(count)) + 1)
+        if gutter != self.gutter_chars:
+            self.gutter_chars = gutter
+            self.viewport().update()
+        bar = self.verticalScrollBar()
+        bar.setPageStep(self.visible_rows())
+        bar.setRange(0, max(0, count - self.visible_rows()))
+
+    def row_rect(self, line):
+        """Viewport rectangle of a 1-based line, or None if not visible"""
+        row = line - 1 - self.verticalScrollBar().value()
+        if line <= 0 or row < 0 or row > self.visible_rows():
+            return None
+        return QRect(0, row * self.line_height, self.viewport().width(), self.line_height)
+
+    def set_current_line(self, line):
+        """Move the highlight to a 1-based line (STAT.motion_line)"""
+        if line == self.current_line or self.program is None:
+            return
+        old_rect = self.row_rect(self.current_line)
+        self.current_line = line
+        new_rect = self.row_rect(line)
+        if new_rect is None:
+            if self.follow and line > 0:
+                # Keep the running line a third of the way down
+                self.program.ensure_line(line)
+                self.update_scroll_range()
+                self.verticalScrollBar().setValue(line - 1 - self.visible_rows() // 3)
+            elif old_rect is not None:
+                self.viewport().update(old_rect)
+            return
+        if old_rect is not None:
+            self.viewport().update(old_rect)
+        self.viewport().update(new_rect)
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scroll_range()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        painter.fillRect(event.rect(), BACKGROUND_COLOR)
+        if self.program is None:
+            return
+        first = self.verticalScrollBar().value()
+        # Only rows inside the damaged rectangle are drawn
+        top_row = event.rect().top() // self.line_height
+        bottom_row = event.rect().bottom() // self.line_height
+        gutter_width = self.gutter_chars * self.char_width
+        width = self.viewport().width()
+        ascent = painter.fontMetrics().ascent()
+        for row in range(top_row, bottom_row + 1):
+            number = first + row
+            if number >= self.program.line_count:
+                break
+            y = row * self.line_height
+            if number + 1 == self.current_line:
+                painter.fillRect(0, y, width, self.line_height, HIGHLIGHT_COLOR)
+            text = self.program.line(number)
+            painter.setPen(DIM_COLOR)
+            painter.drawText(4, y + ascent, str(number + 1))
+            stripped = text.lstrip()
+            is_comment = stripped.startswith((";", "("))
+            painter.setPen(DIM_COLOR if is_comment else TEXT_COLOR)
+            painter.drawText(gutter_width, y + ascent, text)
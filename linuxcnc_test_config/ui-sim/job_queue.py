@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Job Queue storage for John Sawnders
+Reads and writes job_queue.json (see planning/DESIGN_SPEC.md)
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+# Default queue file lives next to the config
+QUEUE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_queue.json")
+
+# Job status values
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETE = "complete"
+STATUS_ERROR = "error"
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over the target
+
+    A crash mid-write leaves the previous file intact.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JobQueue:
+    """In-memory copy of job_queue.json with atomic saves"""
+
+    def __init__(self, path=QUEUE_FILE):
+        """Load the queue file
+
+        Args:
+            path: Location of job_queue.json
+        """
+        self.path = path
+        self.lock = threading.RLock()
+        self.data = {"active_job": None, "queue": []}
+        self.next_id = 1
+        self.piece_listeners = []
+        self.added_listeners = []
+        self.load()
+
+    def load(self):
+        """Load queue from disk, starting empty if the file is missing"""
+        with self.lock:
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    self.data = json.load(f)
+                self.data.setdefault("active_job", None)
+                self.data.setdefault("queue", [])
+            self.next_id = 1
+            for job in self.data["queue"]:
+                try:
+                    self.next_id = max(self.next_id, int(job["id"].split("_")[-1]) + 1)
+                except (KeyError, ValueError):
+                    pass
+
+    def save(self):
+        """Write queue to disk"""
+        with self.lock:
+            write_json_atomic(self.path, self.data)
+
+    @property
+    def jobs(self):
+        """List of job dicts in queue order"""
+        return self.data["queue"]
+
+    def make_job(self, metadata, total_qty, nc_file=None):
+        """Build a job dict in the queue schema (not yet added)"""
+        metadata = dict(metadata)
+        metadata.setdefault("created_timestamp", datetime.now().isoformat(timespec="seconds"))
+        return {
+            "id": None,
+            "nc_file": nc_file,
+            "index": None,
+            "status": STATUS_PENDING,
+            "total_qty": int(total_qty),
+            "completed_qty": 0,
+            "metadata": metadata,
+        }
+
+    def add_jobs(self, jobs):
+        """Append several jobs and save once
+
+        Either every job is written or, if the save fails, none are.
+        """
+        with self.lock:
+            start_id = self.next_id
+            start_len = len(self.data["queue"])
+            for job in jobs:
+                job["id"] = f"job_{self.next_id:03d}"
+                job["index"] = len(self.data["queue"])
+                if not job.get("nc_file"):
+                    job["nc_file"] = f"temp_{self.next_id:03d}.ngc"
+                self.data["queue"].append(job)
+                self.next_id += 1
+            try:
+                self.save()
+            except Exception:
+                del self.data["queue"][start_len:]
+                self.next_id = start_id
+                raise
+            added = self.data["queue"][start_len:]
+        for callback in self.added_listeners:
+            try:
+                callback(added)
+            except Exception as e:
+                print(f"Error in jobs-added listener: {e}")
+        return added
+
+    def add_job(self, metadata, total_qty, nc_file=None):
+        """Create and append a single job"""
+        return self.add_jobs([self.make_job(metadata, total_qty, nc_file)])[0]
+
+    def get_job(self, job_id):
+        """Return job dict by id, or None"""
+        with self.lock:
+            for job in self.data["queue"]:
+                if job["id"] == job_id:
+                    return job
+            return None
+
+    def pending_jobs(self):
+        """Return jobs that still have pieces to cut"""
+        with self.lock:
+            return [job for job in self.data["queue"]
+                    if job["status"] in (STATUS_PENDING, STATUS_RUNNING)]
+
+    def update_job(self, job_id, **fields):
+        """Update top-level job fields and save"""
+        with self.lock:
+            job = self.get_job(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            job.update(fields)
+            self.save()
+            return job
+
+    def subscribe(self, callback):
+        """Call callback(job) every time a piece is completed"""
+        self.piece_listeners.append(callback)
+
+    def subscribe_added(self, callback):
+        """Call callback(jobs) after every batch of jobs is added"""
+        self.added_listeners.append(callback)
+
+    def complete_piece(self, job_id):
+        """Count one finished piece, close the job when qty is reached"""
+        with self.lock:
+            job = self.get_job(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            job["completed_qty"] += 1
+            if job["completed_qty"] >= job["total_qty"]:
+                job["status"] = STATUS_COMPLETE
+                if self.data["active_job"] == job_id:
+                    self.data["active_job"] = None
+            else:
+                job["status"] = STATUS_RUNNING
+                self.data["active_job"] = job_id
+            self.save()
+        for callback in self.piece_listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                print(f"Error in piece listener: {e}")
+        return job
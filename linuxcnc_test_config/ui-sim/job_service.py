@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Job Submission Service for John Sawnders
+Small local HTTP/JSON service so office systems can submit jobs,
+query the queue and follow piece completions without the touchscreen.
+
+Endpoints:
+    POST /jobs                      {"jobs": [job, ...]} -> queued jobs (one save per batch)
+    GET  /jobs[?status=pending]     queue listing
+    GET  /jobs/<id>                 single job
+    GET  /events?since=N&timeout=S  long-poll for events after sequence N
+
+A job is {"total_qty": 5, "metadata": {...}} using the job_queue.json
+metadata schema; the queue assigns the program file name. The server runs
+in daemon threads and never touches Qt. Set [JOBS] HOST/PORT in the INI
+to let office systems reach it.
+"""
+
+import configparser
+import copy
+import json
+import math
+import threading
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from material_db import SHAPE_DIMENSIONS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Longest a long-poll request may wait (seconds)
+MAX_POLL_TIMEOUT = 60.0
+
+# Events kept for clients that fall behind
+EVENT_HISTORY = 1000
+
+
+class EventLog:
+    """Numbered event buffer that long-poll requests can wait on"""
+
+    def __init__(self, size=EVENT_HISTORY):
+        self.events = deque(maxlen=size)
+        self.seq = 0
+        self.cond = threading.Condition()
+
+    def publish(self, event_type, **data):
+        """Append an event and wake any waiting requests"""
+        with self.cond:
+            self.seq += 1
+            self.events.append({"seq": self.seq, "type": event_type, **data})
+            self.cond.notify_all()
+
+    def wait(self, since, timeout):
+        """Return events newer than since, waiting up to timeout for one"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > since, timeout)
+            return [event for event in self.events if event["seq"] > since], self.seq
+
+
+def is_positive_number(value):
+    """True for a finite number above zero (JSON true/false are not numbers)"""
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and math.isfinite(value) and value > 0)
+
+
+def read_service_config(ini_path):
+    """Return (HOST, PORT) from the [JOBS] section of an INI, defaults if unset"""
+    parser = configparser.ConfigParser(strict=False, interpolation=None,
+                                       inline_comment_prefixes=("#", ";"))
+    parser.read(ini_path)
+    host = parser.get("JOBS", "HOST", fallback="").strip() or DEFAULT_HOST
+    port = parser.get("JOBS", "PORT", fallback="").strip()
+    return host, int(port) if port else DEFAULT_PORT
+
+
+def validate_job(job, cut_limit=None):
+    """Check a submitted job, raising ValueError on the first problem"""
+    if not isinstance(job, dict):
+        raise ValueError("job must be an object")
+    metadata = job.get("metadata")
+    if not isinstance(metadata, dict):
+        raise ValueError("job has no metadata")
+    shape = metadata.get("material_shape")
+    if shape not in SHAPE_DIMENSIONS:
+        raise ValueError(f"unknown material shape '{shape}'")
+    dimensions = metadata.get("stock_dimensions") or {}
+    if not isinstance(dimensions, dict):
+        raise ValueError("stock_dimensions must be an object")
+    for field in SHAPE_DIMENSIONS[shape]:
+        if not is_positive_number(dimensions.get(field)):
+            raise ValueError(f"stock_dimensions.{field} must be a positive number")
+    cut_length = metadata.get("cut_length")
+    if not is_positive_number(cut_length):
+        raise ValueError("cut_length must be a positive number")
+    if cut_limit is not None and cut_length > cut_limit:
+        raise ValueError(f"cut_length {cut_length} exceeds machine limit {cut_limit}")
+    qty = job.get("total_qty")
+    if not isinstance(qty, int) or isinstance(qty, bool) or qty <= 0:
+        raise ValueError("total_qty must be a positive integer")
+
+
+class JobService:
+    """HTTP front end for a JobQueue"""
+
+    def __init__(self, queue, host=DEFAULT_HOST, port=DEFAULT_PORT, cut_limit=None):
+        """Set up the service (call start() to begin serving)
+
+        Args:
+            queue: JobQueue to serve
+            host: Interface to bind, local only by default
+            port: TCP port, 0 picks a free one
+            cut_limit: Longest allowed cut_length, None to skip the check
+        """
+        self.queue = queue
+        self.cut_limit = cut_limit
+        self.events = EventLog()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+        queue.subscribe(self.on_piece_complete)
+
+    @property
+    def url(self):
+        """Base URL the service is listening on"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name="job-service", daemon=True)
+        self.thread.start()
+        print(f"Job service listening on {self.url}")
+
+    def stop(self):
+        """Shut down the server"""
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def on_piece_complete(self, job):
+        """Queue listener, turns piece completions into events"""
+        self.events.publish("piece_complete", job_id=job["id"],
+                            completed_qty=job["completed_qty"],
+                            total_qty=job["total_qty"], status=job["status"])
+
+    def submit(self, jobs):
+        """Validate and queue a batch, all or nothing
+
+        Any nc_file in a submission is ignored; the queue names the program
+        (temp_NNN.ngc) so a client can never choose where it is written.
+        """
+        for position, job in enumerate(jobs):
+            try:
+                validate_job(job, self.cut_limit)
+            except ValueError as e:
+                raise ValueError(f"job {position}: {e}")
+        added = self.queue.add_jobs([self.queue.make_job(job["metadata"], job["total_qty"])
+                                     for job in jobs])
+        self.events.publish("jobs_added", job_ids=[job["id"] for job in added])
+        return added
+
+    def make_handler(self):
+        """Build the request handler class bound to this service"""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass  # Keep the LinuxCNC console quiet
+
+            def send_json(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                parts = [part for part in url.path.split("/") if part]
+                try:
+                    if parts == ["jobs"]:
+                        status = params.get("status", [None])[0]
+                        # Copy under the lock, serialize and send outside it so a
+                        # slow client never holds up the queue
+                        with service.queue.lock:
+                            jobs = copy.deepcopy([job for job in service.queue.jobs
+                                                  if status is None or job["status"] == status])
+                            active_job = service.queue.data["active_job"]
+                        self.send_json(200, {"active_job": active_job, "jobs": jobs})
+                    elif len(parts) == 2 and parts[0] == "jobs":
+                        with service.queue.lock:
+                            job = copy.deepcopy(service.queue.get_job(parts[1]))
+                        if job is None:
+                            self.send_json(404, {"error": f"no job {parts[1]}"})
+                        else:
+                            self.send_json(200, job)
+                    elif parts == ["events"]:
+                        since = int(params.get("since", ["0"])[0])
+                        timeout = min(float(params.get("timeout", ["30"])[0]), MAX_POLL_TIMEOUT)
+                        events, seq = service.events.wait(since, timeout)
+                        self.send_json(200, {"seq": seq, "events": events})
+                    else:
+                        self.send_json(404, {"error": "not found"})
+                except ValueError as e:
+                    self.send_json(400, {"error": str(e)})
+
+            def do_POST(self):
+                if urlparse(self.path).path.rstrip("/") != "/jobs":
+                    self.send_json(404, {"error": "not found"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                    if not isinstance(body, dict):
+                        raise ValueError("body must be a JSON object")
+                    jobs = body.get("jobs")
+                    if not isinstance(jobs, list) or not jobs:
+                        raise ValueError("body must contain a non-empty 'jobs' list")
+                    added = service.submit(jobs)
+                except ValueError as e:  # includes JSONDecodeError
+                    self.send_json(400, {"error": str(e)})
+                    return
+                except Exception as e:
+                    self.send_json(500, {"error": str(e)})
+                    return
+                self.send_json(201, {"jobs": added})
+
+        return Handler
+
+
+class JobClient:
+    """Minimal client for the job service (office systems and testing)"""
+
+    def __init__(self, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=5.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, timeout=None):
+        """Send a request and return the decoded JSON response"""
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout or self.timeout) as response:
+            return json.loads(response.read())
+
+    def submit(self, jobs):
+        """Submit a batch of jobs, returns the queued job dicts"""
+        return self.request("POST", "/jobs", {"jobs": jobs})["jobs"]
+
+    def list_jobs(self, status=None):
+        """Return queued jobs, optionally filtered by status"""
+        path = "/jobs" if status is None else f"/jobs?status={status}"
+        return self.request("GET", path)["jobs"]
+
+    def get_job(self, job_id):
+        """Return one job"""
+        return self.request("GET", f"/jobs/{job_id}")
+
+    def poll_events(self, since=0, timeout=30.0):
+        """Long-poll for events after since, returns (events, last seq)"""
+        result = self.request("GET", f"/events?since={since}&timeout={timeout}",
+                              timeout=timeout + self.timeout)
+        return result["events"], result["seq"]
+
+    def follow(self, since=0, timeout=30.0):
+        """Yield events forever as they arrive"""
+        while True:
+            events, since = self.poll_events(since, timeout)
+            yield from events
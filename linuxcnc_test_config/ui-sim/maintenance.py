@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Maintenance Counters for John Sawnders
+Running totals for blade wear and hydraulic service
+
+Totals are updated incrementally (one addition per finished piece, per
+poll of the spindle and per HAL pin edge); history is never rescanned.
+They are kept in maintenance.json, written at most every SAVE_INTERVAL
+seconds.
+"""
+
+import json
+import math
+import os
+import time
+
+from job_queue import write_json_atomic
+from material_db import cross_section_area
+
+# Default counter file lives next to the config
+MAINTENANCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "maintenance.json")
+
+# Minimum seconds between writes of maintenance.json
+SAVE_INTERVAL = 30.0
+
+# Default service thresholds
+DEFAULT_THRESHOLDS = {
+    "blade_area": 3000.0,        # square inches cut per blade
+    "blade_hours": 40.0,         # blade running hours per blade
+    "hydraulic_actuations": 100000,  # vice + solenoid actuations between services
+}
+
+# Handler input pins (netted to the solenoid and valve outputs in
+# postgui.hal) whose rising edges count as hydraulic actuations
+ACTUATION_PINS = ("lift-solenoid", "downfeed-solenoid", "fv-clamp-valve", "fv-unclamp-valve",
+                  "mv-clamp-valve")
+
+
+def empty_totals():
+    """Fresh counter set"""
+    return {
+        "pieces": 0,
+        "cut_area": 0.0,
+        "cut_area_by_material": {},
+        "blade_area": 0.0,
+        "blade_hours": 0.0,
+        "spindle_hours": 0.0,
+        "actuations": {pin: 0 for pin in ACTUATION_PINS},
+        "hydraulic_actuations": 0,
+        "blade_changed": None,
+        "hydraulic_serviced": None,
+    }
+
+
+def is_number(value):
+    """True for a finite int/float (JSON true/false are not numbers)"""
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and math.isfinite(value))
+
+
+class MaintenanceCounters:
+    """Incremental maintenance totals with cheap persistence"""
+
+    def __init__(self, path=MAINTENANCE_FILE):
+        """Load counters
+
+        Args:
+            path: Location of maintenance.json
+        """
+        self.path = path
+        self.totals = empty_totals()
+        self.thresholds = dict(DEFAULT_THRESHOLDS)
+        self.dirty = False
+        self.last_save = time.monotonic()
+        self.spindle_since = None
+        self.pin_states = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    raise ValueError("not a JSON object")
+            except (OSError, ValueError) as e:
+                print(f"Maintenance file unreadable, starting from zero: {e}")
+                data = {}
+            self.load_totals(data.get("totals"))
+            self.load_thresholds(data.get("thresholds"))
+
+    def load_totals(self, stored):
+        """Take stored totals that have the right type, keep defaults for the rest"""
+        if not isinstance(stored, dict):
+            return
+        for name, default in empty_totals().items():
+            value = stored.get(name, default)
+            if isinstance(default, dict):
+                valid = isinstance(value, dict) and all(is_number(v) and v >= 0
+                                                        for v in value.values())
+            elif default is None:
+                valid = value is None or isinstance(value, str)
+            else:
+                valid = is_number(value) and value >= 0
+            if valid:
+                self.totals[name] = value
+            else:
+                print(f"Maintenance total {name} invalid ({value!r}), starting from zero")
+        for pin in ACTUATION_PINS:
+            self.totals["actuations"].setdefault(pin, 0)
+
+    def load_thresholds(self, stored):
+        """Take stored thresholds that are positive numbers, defaults otherwise"""
+        if not isinstance(stored, dict):
+            return
+        for name in DEFAULT_THRESHOLDS:
+            if name not in stored:
+                continue
+            value = stored[name]
+            if is_number(value) and value > 0:
+                self.thresholds[name] = value
+            else:
+                print(f"Maintenance threshold {name} invalid ({value!r}), using default")
+
+    def save(self, force=False):
+        """Write counters if changed and the save interval has passed"""
+        now = time.monotonic()
+        if not self.dirty or (not force and now - self.last_save < SAVE_INTERVAL):
+            return
+        write_json_atomic(self.path, {"totals": self.totals, "thresholds": self.thresholds})
+        self.dirty = False
+        self.last_save = now
+
+    def on_piece_complete(self, job):
+        """JobQueue listener: add one cut's cross-section to the totals"""
+        metadata = job.get("metadata", {})
+        try:
+            area = cross_section_area(metadata["material_shape"], metadata["stock_dimensions"])
+        except (KeyError, TypeError):
+            return
+        material = metadata.get("material_type") or "unknown"
+        by_material = self.totals["cut_area_by_material"]
+        by_material[material] = by_material.get(material, 0.0) + area
+        self.totals["cut_area"] += area
+        self.totals["blade_area"] += area
+        self.totals["pieces"] += 1
+        self.dirty = True
+        self.save()
+
+    def update_spindle(self, spindle_on, now=None):
+        """Accumulate blade running time; call from the periodic update"""
+        now = time.monotonic() if now is None else now
+        if self.spindle_since is not None:
+            hours = (now - self.spindle_since) / 3600.0
+            self.totals["blade_hours"] += hours
+            self.totals["spindle_hours"] += hours
+            self.dirty = True
+        self.spindle_since = now if spindle_on else None
+
+    def update_pins(self, states):
+        """Count rising edges of actuation pins
+
+        Args:
+            states: dict of pin name -> current bool value
+        """
+        for pin, value in states.items():
+            if value and not self.pin_states.get(pin, False):
+                self.totals["actuations"][pin] = self.totals["actuations"].get(pin, 0) + 1
+                self.totals["hydraulic_actuations"] += 1
+                self.dirty = True
+            self.pin_states[pin] = bool(value)
+
+    def blade_due(self):
+        """True when the blade has reached its area or hours threshold"""
+        return (self.totals["blade_area"] >= self.thresholds["blade_area"]
+                or self.totals["blade_hours"] >= self.thresholds["blade_hours"])
+
+    def hydraulic_due(self):
+        """True when hydraulic service is due"""
+        return self.totals["hydraulic_actuations"] >= self.thresholds["hydraulic_actuations"]
+
+    def blade_wear(self):
+        """Fraction of blade life used (largest of area and hours)"""
+        return max(self.totals["blade_area"] / self.thresholds["blade_area"],
+                   self.totals["blade_hours"] / self.thresholds["blade_hours"])
+
+    def reset_blade(self):
+        """Record a blade change"""
+        self.totals["blade_area"] = 0.0
+        self.totals["blade_hours"] = 0.0
+        self.totals["blade_changed"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.dirty = True
+        self.save(force=True)
+
+    def reset_hydraulics(self):
+        """Record a hydraulic service"""
+        self.totals["hydraulic_actuations"] = 0
+        self.totals["hydraulic_serviced"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.dirty = True
+        self.save(force=True)
+
+    def summary(self):
+        """Short text for the Settings tab"""
+        blade = "BLADE CHANGE DUE" if self.blade_due() else f"Blade {self.blade_wear():.0%} used"
+        hydraulic = ("HYDRAULIC SERVICE DUE" if self.hydraulic_due() else
+                     f"Hydraulics {self.totals['hydraulic_actuations']}/"
+                     f"{self.thresholds['hydraulic_actuations']} actuations")
+        return (f"{blade} ({self.totals['blade_area']:.0f} sq in, "
+                f"{self.totals['blade_hours']:.1f} h)\n"
+                f"{hydraulic}\n"
+                f"{self.totals['pieces']} pieces, {self.totals['spindle_hours']:.1f} spindle hours total")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Material Database for John Sawnders
+Feeds and speeds per material grade and profile (head clearance is an
+operator setting, see settings_store.py)
+
+Data lives in materials.json and is held in memory; the file is re-read
+automatically when it changes on disk. Lookups are plain dict hits so the
+conversational screen can query on every keystroke.
+"""
+
+import bisect
+import json
+import math
+import os
+import time
+
+# Default database file lives next to the config
+MATERIALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "materials.json")
+
+# Seconds between checks for a changed materials.json
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Dimension fields required for each material shape
+SHAPE_DIMENSIONS = {
+    "round": ("diameter",),
+    "square": ("size",),
+    "rectangular": ("width", "height"),
+    "hex": ("flats",),
+    "tube": ("od", "wall"),
+    "angle": ("leg1", "leg2", "thickness"),
+}
+
+# Height of the stock under the blade (DESIGN_SPEC.md material table)
+SHAPE_HEIGHT = {
+    "round": lambda d: d["diameter"],
+    "square": lambda d: d["size"],
+    "rectangular": lambda d: d["height"],
+    "hex": lambda d: d["flats"] * 1.155,
+    "tube": lambda d: d["od"],
+    "angle": lambda d: max(d["leg1"], d["leg2"]),
+}
+
+# Cross-section area of the stock (square inches for inch dimensions)
+SHAPE_AREA = {
+    "round": lambda d: math.pi / 4 * d["diameter"] ** 2,
+    "square": lambda d: d["size"] ** 2,
+    "rectangular": lambda d: d["width"] * d["height"],
+    "hex": lambda d: math.sqrt(3) / 2 * d["flats"] ** 2,
+    "tube": lambda d: math.pi / 4 * (d["od"] ** 2 - max(d["od"] - 2 * d["wall"], 0) ** 2),
+    "angle": lambda d: d["thickness"] * (d["leg1"] + d["leg2"] - d["thickness"]),
+}
+
+
+def stock_height(shape, dimensions):
+    """Height of the stock in the vice for the given profile"""
+    return SHAPE_HEIGHT[shape](dimensions)
+
+
+def cross_section_area(shape, dimensions):
+    """Area the blade passes through for one cut"""
+    return SHAPE_AREA[shape](dimensions)
+
+
+class MaterialDB:
+    """In-memory material index with reload on file change"""
+
+    def __init__(self, path=MATERIALS_FILE):
+        """Load the database
+
+        Args:
+            path: Location of materials.json
+        """
+        self.path = path
+        self.mtime = None
+        self.next_check = 0.0
+        self.load()
+
+    def load(self):
+        """(Re)build the in-memory indexes from disk
+
+        Indexes are built aside and swapped in only once the whole file
+        has been read, so a bad edit leaves the previous data in place.
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path) as f:
+            data = json.load(f)
+
+        factors = data.get("profile_factors", {})
+        materials = data.get("materials", {})
+
+        # grade key -> canonical name, including aliases
+        names = {}
+        for name, entry in materials.items():
+            names[name.lower()] = name
+            for alias in entry.get("aliases", ()):
+                names[alias.lower()] = name
+
+        # (canonical name, shape) -> precomputed recommendation
+        recommendations = {}
+        for name, entry in materials.items():
+            for shape in SHAPE_DIMENSIONS:
+                factor = factors.get(shape, {})
+                recommendations[(name, shape)] = {
+                    "material_type": name,
+                    "material_shape": shape,
+                    "blade_speed": min(100, round(entry["blade_speed"] * factor.get("blade_speed", 1.0))),
+                    "downfeed_rate": round(entry["downfeed_rate"] * factor.get("downfeed_rate", 1.0), 3),
+                }
+
+        self.names = names
+        self.sorted_keys = sorted(names)
+        self.recommendations = recommendations
+        self.mtime = mtime
+
+    def check_reload(self):
+        """Reload if materials.json changed, at most once per interval"""
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + RELOAD_CHECK_INTERVAL
+        try:
+            if os.stat(self.path).st_mtime_ns != self.mtime:
+                self.load()
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Material database not reloaded: {e}")
+
+    def resolve(self, grade):
+        """Canonical material name for a grade or alias, or None"""
+        self.check_reload()
+        return self.names.get(grade.strip().lower())
+
+    def search(self, prefix, limit=10):
+        """Material names whose name or alias starts with prefix"""
+        self.check_reload()
+        prefix = prefix.strip().lower()
+        start = bisect.bisect_left(self.sorted_keys, prefix)
+        found = []
+        for key in self.sorted_keys[start:]:
+            if not key.startswith(prefix):
+                break
+            name = self.names[key]
+            if name not in found:
+                found.append(name)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def recommend(self, grade, shape):
+        """Recommended blade speed (%) and downfeed rate for a grade/profile
+
+        Returns None for an unknown grade or shape.
+        """
+        name = self.resolve(grade)
+        if name is None:
+            return None
+        return self.recommendations.get((name, shape))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+G-code parsing helpers for the cut cycle programs
+Shared by the plant simulator and the pre-load checker
+
+Covers the subset the generated programs use: named and numbered
+parameters, bracket expressions, O-word subs and if/elseif/else blocks,
+(abort, ...) comments and single-letter words. Loops are parsed but left
+to the caller to refuse.
+"""
+
+import ast
+import math
+import operator
+import re
+
+# M66 P inputs (motion.digital-in-NN)
+INPUT_HEAD_AT_TARGET = 0
+INPUT_BOTTOM_LIMIT = 1
+
+# M64/M65 P outputs (motion.digital-out-NN)
+OUTPUT_LIFT = 1
+OUTPUT_DOWNFEED = 2
+
+# M66 result parameter (-1 after a timeout)
+INPUT_RESULT = "5399"
+
+# Numbered parameters from here up are set by the machine at run time
+FIRST_SYSTEM_PARAMETER = 5000
+
+# Saw-specific user M-codes (DESIGN_SPEC.md)
+USER_MCODES = {
+    101: "clamp fixed vice",
+    102: "unclamp fixed vice (pulse)",
+    103: "fixed vice neutral",
+    104: "clamp moving vice",
+    105: "release moving vice",
+}
+
+# Largest exponent accepted in expressions
+MAX_EXPONENT = 64
+
+PARAMETER = re.compile(r"#<(\w+)>|#(\d+)")
+ASSIGNMENT = re.compile(r"#(?:<(\w+)>|(\d+))\s*=\s*(.+)")
+OWORD = re.compile(r"[oO](<\w+>|\d+)\s*([a-zA-Z]+)\s*(.*)")
+MESSAGE = re.compile(r"\(\s*(abort|debug|print|msg)\s*,([^)]*)\)", re.IGNORECASE)
+OPERATOR_WORDS = [(re.compile(rf"\b{word}\b"), symbol) for word, symbol in (
+    ("LT", "<"), ("GT", ">"), ("LE", "<="), ("GE", ">="), ("EQ", "=="), ("NE", "!="),
+    ("AND", " and "), ("OR", " or "), ("XOR", "^"), ("MOD", "%"))]
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.BitXor: lambda a, b: float(bool(a) != bool(b)),
+}
+COMPARISONS = {
+    ast.Lt: operator.lt, ast.Gt: operator.gt, ast.LtE: operator.le,
+    ast.GtE: operator.ge, ast.Eq: operator.eq, ast.NotEq: operator.ne,
+}
+FUNCTIONS = {
+    "ABS": abs, "SQRT": lambda x: x ** 0.5, "FIX": lambda x: float(int(x // 1)),
+    "FUP": lambda x: float(-int(-x // 1)), "ROUND": lambda x: float(round(x)),
+}
+
+
+class RuntimeParameter(ValueError):
+    """Expression uses a value only known while the program runs"""
+
+
+def parameter_key(named, numbered):
+    """Params dict key: lowercase name, or the number as a string"""
+    return named.lower() if named else numbered
+
+
+def strip_comments(line):
+    """Remove ; and (...) comments and surrounding whitespace"""
+    return re.sub(r"\([^)]*\)", "", line.split(";", 1)[0]).strip()
+
+
+def evaluate(expression, params):
+    """Evaluate a number, parameter or [expression]
+
+    Only numeric operators, comparisons and a few functions are allowed;
+    exponents are bounded so no expression can run away.
+
+    Raises RuntimeParameter for system parameters not in params, and
+    ValueError for undefined named parameters or unsupported syntax.
+    """
+    def lookup(match):
+        named, numbered = match.groups()
+        key = parameter_key(named, numbered)
+        if key in params:
+            return repr(float(params[key]))
+        if named:
+            raise ValueError(f"undefined parameter #<{named}>")
+        if int(numbered) >= FIRST_SYSTEM_PARAMETER:
+            raise RuntimeParameter(f"#{numbered} is only known at run time")
+        return "0.0"  # numbered parameters start at zero
+
+    text = PARAMETER.sub(lookup, expression).upper().replace("[", "(").replace("]", ")")
+    for pattern, symbol in OPERATOR_WORDS:
+        text = pattern.sub(symbol, text)
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+        value = float(_evaluate_node(tree.body))
+    except RuntimeParameter:
+        raise
+    except (SyntaxError, ArithmeticError, TypeError, ValueError) as e:
+        raise ValueError(f"bad expression {expression}: {e}")
+    if not math.isfinite(value):
+        raise ValueError(f"bad expression {expression}: result is not finite")
+    return value
+
+
+def _evaluate_node(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+            and not isinstance(node.value, bool):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd, ast.Not)):
+        value = _evaluate_node(node.operand)
+        if isinstance(node.op, ast.Not):
+            return float(not value)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        left, right = _evaluate_node(node.left), _evaluate_node(node.right)
+        if isinstance(node.op, ast.Pow) and abs(right) > MAX_EXPONENT:
+            raise ValueError(f"exponent {right:g} is larger than {MAX_EXPONENT}")
+        return BINARY_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in COMPARISONS:
+        return float(COMPARISONS[type(node.ops[0])](_evaluate_node(node.left),
+                                                    _evaluate_node(node.comparators[0])))
+    if isinstance(node, ast.BoolOp):
+        values = [bool(_evaluate_node(value)) for value in node.values]
+        return float(all(values) if isinstance(node.op, ast.And) else any(values))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in FUNCTIONS and len(node.args) == 1 and not node.keywords):
+        return float(FUNCTIONS[node.func.id](_evaluate_node(node.args[0])))
+    raise ValueError(f"unsupported syntax {type(node).__name__}")
+
+
+def split_words(line):
+    """Split a block into (letter, value text) pairs, brackets may nest"""
+    words = []
+    position = 0
+    length = len(line)
+    while position < length:
+        char = line[position]
+        if char.isspace():
+            position += 1
+            continue
+        if not char.isalpha():
+            raise ValueError(f"unexpected '{char}' in '{line}'")
+        position += 1
+        while position < length and line[position].isspace():
+            position += 1
+        start = position
+        if position < length and line[position] == "[":
+            depth = 0
+            while position < length:
+                depth += {"[": 1, "]": -1}.get(line[position], 0)
+                position += 1
+                if depth == 0:
+                    break
+            if depth:
+                raise ValueError(f"unbalanced brackets in '{line}'")
+        else:
+            match = re.compile(r"#<\w+>|#\d+|[-+]?[\d.]+").match(line, position)
+            if not match:
+                raise ValueError(f"word {char} has no value in '{line}'")
+            position = match.end()
+        words.append((char.upper(), line[start:position]))
+    return words
+
+
+def block_words(line, params):
+    """Split a block into (letter, value) pairs"""
+    return [(letter, evaluate(value, params)) for letter, value in split_words(line)]
+
+
+def parse_program(text):
+    """Split a program into the main body and its O-word subs
+
+    Returns (main, subs): lists of (line_number, kind, value) items where
+    kind is
+        "line"   value is the comment-free block
+        "call"   value is the sub name
+        "abort"  value is the (abort, ...) message
+        "if"     value is a list of (condition or None for else, items)
+        "loop"   value is (keyword, items) for while/do/repeat
+        "flow"   value is return/break/continue
+    subs maps sub name to its items.
+
+    Raises ValueError for unbalanced O-word blocks.
+    """
+    subs = {}
+    main = []
+    # Open blocks: (kind, label, item list being filled, branch list for if)
+    stack = [("main", None, main, None)]
+    for number, raw in enumerate(text.splitlines(), 1):
+        items = stack[-1][2]
+        message = MESSAGE.search(raw.split(";", 1)[0])
+        if message and message.group(1).lower() == "abort":
+            items.append((number, "abort", message.group(2).strip()))
+        line = strip_comments(raw)
+        if not line:
+            continue
+        match = OWORD.match(line)
+        if not match:
+            items.append((number, "line", line))
+            continue
+        label, keyword, rest = match.group(1).lower(), match.group(2).lower(), match.group(3)
+        name = label.strip("<>")
+        kind = stack[-1][0]
+        if keyword == "sub":
+            body = subs.setdefault(name, [])
+            stack.append(("sub", label, body, None))
+        elif keyword == "call":
+            items.append((number, "call", name))
+        elif keyword == "if":
+            branches = [(rest, [])]
+            items.append((number, "if", branches))
+            stack.append(("if", label, branches[0][1], branches))
+        elif keyword in ("elseif", "else") and kind == "if" and stack[-1][1] == label:
+            branches = stack.pop()[3]
+            branches.append((rest if keyword == "elseif" else None, []))
+            stack.append(("if", label, branches[-1][1], branches))
+        elif keyword in ("while", "do", "repeat"):
+            if keyword == "while" and kind == "do" and stack[-1][1] == label:
+                stack.pop()  # 'oN while' closing an 'oN do'
+                continue
+            body = []
+            items.append((number, "loop", (keyword, body)))
+            stack.append(("do" if keyword == "do" else "loop", label, body, None))
+        elif keyword in ("endsub", "endif", "endwhile", "endrepeat"):
+            expected = {"endsub": "sub", "endif": "if"}.get(keyword, "loop")
+            if kind != expected or stack[-1][1] != label:
+                raise ValueError(f"line {number}: o{label} {keyword} without matching block")
+            stack.pop()
+        elif keyword in ("return", "break", "continue"):
+            items.append((number, "flow", keyword))
+        else:
+            raise ValueError(f"line {number}: unknown O-word keyword '{keyword}'")
+    if len(stack) > 1:
+        raise ValueError(f"o{stack[-1][1]} {stack[-1][0]} is never closed")
+    return main, subs
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Saw Plant Simulator for John Sawnders
+Models the hydraulic head, vices, shuttle, downfeed and blade pulses
+
+Runs two ways:
+    loadusr -Wn plant python3 plant_sim.py hal
+        HAL userspace component for the sim configs (real time)
+    python3 plant_sim.py soak [--queue job_queue.json] [--speed 0]
+        Runs every queued job's generated program against the model on a
+        virtual clock (speed 0 = as fast as possible, N = N x real time)
+
+The model also checks the DESIGN_SPEC.md safety interlocks and records
+every violation, so sequencing bugs show up in a soak run.
+"""
+
+import argparse
+import sys
+import time
+
+from material_db import MaterialDB, stock_height
+from ngc_program import (ASSIGNMENT, INPUT_BOTTOM_LIMIT, INPUT_HEAD_AT_TARGET, INPUT_RESULT,
+                         OUTPUT_DOWNFEED, OUTPUT_LIFT, block_words, evaluate, parameter_key,
+                         parse_program)
+
+# Simulation step (seconds of machine time)
+STEP = 0.01
+
+# ProgramRunner.execute() result for an O-word return
+RETURN = "return"
+
+# Plant parameters (inches, seconds)
+PLANT_DEFAULTS = {
+    "lift_rate": 1.0,           # head lift speed, in/s
+    "fall_rate": 2.0,           # fast downfeed above the stock, in/s
+    "max_height": 12.0,         # head travel
+    "start_height": 6.0,        # head position at power up
+    "target_tolerance": 0.02,   # head-at-target comparator window
+    "fixed_vice_stroke": 0.4,   # s, full stroke under pressure
+    "moving_vice_stroke": 0.6,  # s, clamp stroke
+    "spring_return": 0.8,       # s, moving vice spring return
+    "rpm_at_full_speed": 600.0, # blade pulley rpm at 100%
+    "pulses_per_rev": 1,        # photo eye pulses per pulley rev
+    "cut_rate": 1.0 / 60.0,     # in/s through the stock if no material given
+}
+
+
+class PlantModel:
+    """Physical state of the saw, advanced with step(dt)"""
+
+    def __init__(self, params=None):
+        self.params = dict(PLANT_DEFAULTS)
+        if params:
+            self.params.update(params)
+        p = self.params
+        self.time = 0.0
+        self.head_height = p["start_height"]
+        self.head_target = 0.0
+        self.material_height = 0.0
+        self.cut_rate = p["cut_rate"]
+        self.lift_sol = False
+        self.downfeed_sol = False
+        self.fv_cmd = "clamp"       # clamp | unclamp | neutral
+        self.fv_pos = 1.0           # 1 = closed on the stock
+        self.mv_clamp = False
+        self.mv_pos = 0.0
+        self.shuttle_pos = 0.0
+        self.spindle_on = False
+        self.spindle_speed = 0.0    # percent
+        self.blade_revs = 0.0
+        self.blade_pulses = 0
+        self.violations = []
+
+    # Derived signals
+    @property
+    def head_at_target(self):
+        return self.head_height >= self.head_target - self.params["target_tolerance"]
+
+    @property
+    def bottom_limit(self):
+        return self.head_height <= 0.0
+
+    @property
+    def fv_clamped(self):
+        return self.fv_cmd == "clamp" and self.fv_pos >= 1.0
+
+    @property
+    def mv_clamped(self):
+        return self.mv_clamp and self.mv_pos >= 1.0
+
+    @property
+    def blade_rpm(self):
+        return self.params["rpm_at_full_speed"] * self.spindle_speed / 100.0 if self.spindle_on else 0.0
+
+    @property
+    def in_cut(self):
+        """Blade is down in the stock"""
+        return self.head_height < self.material_height
+
+    @property
+    def head_clear(self):
+        """Head is above the stock, so the shuttle may move"""
+        return self.head_height >= self.material_height
+
+    def violation(self, rule):
+        """Record an interlock violation once per occurrence"""
+        if not self.violations or self.violations[-1][1] != rule:
+            self.violations.append((round(self.time, 3), rule))
+
+    # Inputs with interlock checks
+    def set_fixed_vice(self, cmd):
+        if cmd != self.fv_cmd and self.in_cut:
+            self.violation("vice operation during cutting")
+        self.fv_cmd = cmd
+
+    def set_moving_vice(self, clamp):
+        if clamp != self.mv_clamp and self.in_cut:
+            self.violation("vice operation during cutting")
+        self.mv_clamp = clamp
+
+    def check_shuttle_move(self):
+        if not (self.fv_clamped or self.mv_clamped):
+            self.violation("shuttle movement with vices open")
+        if not self.head_clear:
+            self.violation("shuttle movement with head not raised")
+
+    def set_shuttle(self, position):
+        if abs(position - self.shuttle_pos) > 1e-6:
+            self.check_shuttle_move()
+        self.shuttle_pos = position
+
+    def step(self, dt=STEP):
+        """Advance the plant by dt seconds"""
+        p = self.params
+        self.time += dt
+
+        # Head: lift wins over downfeed if both are on
+        if self.lift_sol:
+            self.head_height = min(p["max_height"], self.head_height + p["lift_rate"] * dt)
+        elif self.downfeed_sol:
+            if self.head_height > self.material_height:
+                # Fast fall until the blade meets the stock
+                self.head_height = max(self.material_height,
+                                       self.head_height - p["fall_rate"] * dt)
+            elif self.blade_rpm > 0:
+                if not self.fv_clamped:
+                    self.violation("cutting without fixed vice clamped")
+                self.head_height -= self.cut_rate * dt
+            else:
+                self.violation("downfeed into stock with blade stopped")
+            self.head_height = max(0.0, self.head_height)
+
+        # Fixed vice: double acting, holds position in neutral
+        if self.fv_cmd == "clamp":
+            self.fv_pos = min(1.0, self.fv_pos + dt / p["fixed_vice_stroke"])
+        elif self.fv_cmd == "unclamp":
+            self.fv_pos = max(0.0, self.fv_pos - dt / p["fixed_vice_stroke"])
+
+        # Moving vice: single acting, spring return
+        if self.mv_clamp:
+            self.mv_pos = min(1.0, self.mv_pos + dt / p["moving_vice_stroke"])
+        else:
+            self.mv_pos = max(0.0, self.mv_pos - dt / p["spring_return"])
+
+        # Blade pulley photo eye
+        self.blade_revs += self.blade_rpm / 60.0 * dt
+        self.blade_pulses = int(self.blade_revs * p["pulses_per_rev"])
+
+
+class ProgramRunner:
+    """Executes the cut cycle subset of G-code against a PlantModel
+
+    Handles parameters, O-word subs and if blocks, (abort, ...), G1 Z, G4,
+    S/M3/M5, M64-M67 and the saw's M101-M105, advancing the plant on a
+    virtual clock. M66 sets #5399 like LinuxCNC (-1 on timeout).
+    """
+
+    def __init__(self, plant, speed=0.0, shuttle_feed_default=10.0):
+        """Set up the runner
+
+        Args:
+            plant: PlantModel to drive
+            speed: Real-time multiple to pace at, 0 runs flat out
+        """
+        self.plant = plant
+        self.speed = speed
+        self.params = {}
+        self.feed = shuttle_feed_default
+        self.timeouts = []
+        self.aborts = []
+        self.wall_start = time.monotonic()
+        self.sim_start = plant.time
+
+    def advance(self, seconds):
+        """Step the plant for seconds of machine time"""
+        steps = int(round(seconds / STEP))
+        for _ in range(steps):
+            self.plant.step(STEP)
+        self.pace()
+
+    def wait_for(self, condition, timeout):
+        """Step until condition() or timeout, returns True if met"""
+        elapsed = 0.0
+        while not condition():
+            if elapsed >= timeout:
+                return False
+            self.plant.step(STEP)
+            elapsed += STEP
+        self.pace()
+        return True
+
+    def pace(self):
+        if self.speed > 0:
+            ahead = (self.plant.time - self.sim_start) / self.speed - (time.monotonic() - self.wall_start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def run(self, text):
+        """Execute a program"""
+        main, subs = parse_program(text)
+        self.execute(main, subs)
+
+    def execute(self, block, subs):
+        """Execute a list of parsed items
+
+        Returns False at program end or abort, RETURN on an O-word return,
+        True otherwise.
+        """
+        for number, kind, item in block:
+            if kind == "call":
+                if self.execute(subs.get(item, []), subs) is False:
+                    return False
+            elif kind == "if":
+                for condition, body in item:
+                    if condition is None or evaluate(condition, self.params):
+                        result = self.execute(body, subs)
+                        if result is not True:
+                            return result
+                        break
+            elif kind == "loop":
+                raise ValueError(f"line {number}: O-word {item[0]} loops are not simulated")
+            elif kind == "flow":
+                if item == "return":
+                    return RETURN
+            elif kind == "abort":
+                self.aborts.append((round(self.plant.time, 3), f"aborted: {item}"))
+                return False
+            elif not self.block(item):
+                return False
+        return True
+
+    def block(self, line):
+        """Execute one line, returns False at program end"""
+        plant = self.plant
+        match = ASSIGNMENT.match(line)
+        if match:
+            named, numbered, expression = match.groups()
+            self.params[parameter_key(named, numbered)] = evaluate(expression, self.params)
+            return True
+
+        words = block_words(line, self.params)
+        values = dict(words)
+        for letter, value in words:
+            if letter == "S":
+                plant.spindle_speed = value
+            elif letter == "F":
+                self.feed = value
+        for letter, value in words:
+            code = int(value) if letter in "GM" else None
+            if letter == "G" and code in (0, 1) and "Z" in values:
+                distance = abs(values["Z"] - plant.shuttle_pos)
+                if distance > 1e-6:
+                    plant.check_shuttle_move()
+                    self.advance(distance / max(self.feed, 1e-6) * 60.0)
+                    plant.shuttle_pos = values["Z"]
+            elif letter == "G" and code == 4:
+                self.advance(values.get("P", 0.0))
+            elif letter == "M":
+                if not self.m_code(code, values):
+                    return False
+        return True
+
+    def m_code(self, code, values):
+        plant = self.plant
+        if code == 3:
+            plant.spindle_on = True
+        elif code == 5:
+            plant.spindle_on = False
+        elif code in (2, 30):
+            return False
+        elif code == 101:
+            plant.set_fixed_vice("clamp")
+        elif code == 102:
+            plant.set_fixed_vice("unclamp")
+            self.advance(0.5)
+            plant.set_fixed_vice("neutral")
+        elif code == 103:
+            plant.set_fixed_vice("neutral")
+        elif code == 104:
+            plant.set_moving_vice(True)
+        elif code == 105:
+            plant.set_moving_vice(False)
+            self.advance(1.0)
+        elif code in (64, 65):
+            output = int(values.get("P", -1))
+            if output == OUTPUT_LIFT:
+                plant.lift_sol = code == 64
+            elif output == OUTPUT_DOWNFEED:
+                plant.downfeed_sol = code == 64
+        elif code == 67:
+            plant.head_target = values.get("Q", 0.0)
+        elif code == 66:
+            inputs = {INPUT_HEAD_AT_TARGET: lambda: plant.head_at_target,
+                      INPUT_BOTTOM_LIMIT: lambda: plant.bottom_limit}
+            condition = inputs.get(int(values.get("P", -1)))
+            if condition is not None:
+                if self.wait_for(condition, values.get("Q", 0.0)):
+                    self.params[INPUT_RESULT] = 1.0
+                else:
+                    self.params[INPUT_RESULT] = -1.0
+                    self.timeouts.append((round(plant.time, 3), f"M66 P{int(values['P'])} timed out"))
+        return True
+
+
+def soak(queue_path, speed=0.0, limit=None):
+    """Run every pending piece in the queue through the plant model"""
+    from cut_program import CutProgramGenerator
+    from job_queue import JobQueue
+    from settings_store import Settings
+
+    queue = JobQueue(queue_path)
+    materials = MaterialDB()
+    generator = CutProgramGenerator(Settings(), materials)
+    plant = PlantModel()
+    runner = ProgramRunner(plant, speed)
+    pieces = 0
+    start = time.monotonic()
+    for job in queue.pending_jobs():
+        metadata = job["metadata"]
+        plant.material_height = stock_height(metadata["material_shape"], metadata["stock_dimensions"])
+        recommendation = materials.recommend(metadata.get("material_type") or "",
+                                             metadata["material_shape"])
+        if recommendation:
+            plant.cut_rate = recommendation["downfeed_rate"] / 60.0
+        program = generator.generate(job)
+        for _ in range(job["total_qty"] - job["completed_qty"]):
+            runner.run(program)
+            pieces += 1
+            if limit and pieces >= limit:
+                break
+        if limit and pieces >= limit:
+            break
+    wall = time.monotonic() - start
+    print(f"{pieces} pieces, {plant.time / 3600:.2f} h machine time in {wall:.1f} s "
+          f"({plant.time / max(wall, 1e-9):.0f}x)")
+    # Repeated findings are reported once with a count and first time
+    findings = {}
+    for when, message in (runner.timeouts + runner.aborts
+                          + [(w, f"INTERLOCK {r}") for w, r in plant.violations]):
+        first, count = findings.get(message, (when, 0))
+        findings[message] = (first, count + 1)
+    for message, (first, count) in sorted(findings.items(), key=lambda item: item[1][0]):
+        print(f"  {message}: {count}x, first at t={first}s")
+    return 1 if runner.timeouts or plant.violations else 0
+
+
+def run_hal():
+    """Run as a HAL userspace component named 'plant'"""
+    import hal
+
+    comp = hal.component("plant")
+    for name in ("lift-sol", "downfeed-sol", "fv-clamp", "fv-unclamp", "mv-clamp", "spindle-on"):
+        comp.newpin(name, hal.HAL_BIT, hal.HAL_IN)
+    for name in ("spindle-speed", "head-target", "material-height", "shuttle-pos", "cut-rate"):
+        comp.newpin(name, hal.HAL_FLOAT, hal.HAL_IN)
+    for name in ("head-at-target", "bottom-limit", "fv-clamped", "mv-clamped", "blade-pulse",
+                 "fault"):
+        comp.newpin(name, hal.HAL_BIT, hal.HAL_OUT)
+    for name in ("head-height", "blade-rpm"):
+        comp.newpin(name, hal.HAL_FLOAT, hal.HAL_OUT)
+    comp.newpin("blade-pulses", hal.HAL_S32, hal.HAL_OUT)
+    comp.ready()
+
+    plant = PlantModel()
+    last = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            plant.lift_sol = comp["lift-sol"]
+            plant.downfeed_sol = comp["downfeed-sol"]
+            plant.set_fixed_vice("clamp" if comp["fv-clamp"] else
+                                 "unclamp" if comp["fv-unclamp"] else "neutral")
+            plant.set_moving_vice(comp["mv-clamp"])
+            plant.spindle_on = comp["spindle-on"]
+            plant.spindle_speed = comp["spindle-speed"]
+            plant.head_target = comp["head-target"]
+            plant.material_height = comp["material-height"]
+            if comp["cut-rate"] > 0:
+                plant.cut_rate = comp["cut-rate"] / 60.0
+            plant.set_shuttle(comp["shuttle-pos"])
+            plant.step(now - last)
+            last = now
+            comp["head-height"] = plant.head_height
+            comp["head-at-target"] = plant.head_at_target
+            comp["bottom-limit"] = plant.bottom_limit
+            comp["fv-clamped"] = plant.fv_clamped
+            comp["mv-clamped"] = plant.mv_clamped
+            comp["blade-rpm"] = plant.blade_rpm
+            comp["blade-pulses"] = plant.blade_pulses
+            comp["blade-pulse"] = bool(plant.blade_pulses & 1)
+            comp["fault"] = bool(plant.violations)
+            time.sleep(STEP)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Bandsaw plant simulator")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("hal", help="run as HAL component 'plant'")
+    p = sub.add_parser("soak", help="run the job queue on a virtual clock")
+    p.add_argument("--queue", help="job_queue.json to run (default: config queue)")
+    p.add_argument("--speed", type=float, default=0.0,
+                   help="real-time multiple, 0 = as fast as possible")
+    p.add_argument("--pieces", type=int, help="stop after this many pieces")
+    args = parser.parse_args(argv)
+
+    if args.command == "hal":
+        run_hal()
+        return 0
+    from job_queue import QUEUE_FILE
+    return soak(args.queue or QUEUE_FILE, args.speed, args.pieces)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
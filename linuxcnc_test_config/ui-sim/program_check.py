@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Pre-load Checker for Cut Cycle Programs
+Walks a generated .ngc symbolically and checks it against the M-code
+semantics and safety interlocks in DESIGN_SPEC.md
+
+Usage:
+    python3 program_check.py temp_001.ngc [more.ngc ...]
+    python3 program_check.py --queue job_queue.json
+
+Results are cached by the hash of the program without its ; comments, so
+jobs that differ only in their header comment (the same geometry) are
+walked once and re-checking an unchanged job costs one hash.
+"""
+
+import argparse
+import copy
+import hashlib
+import sys
+from collections import namedtuple
+
+from ngc_program import (ASSIGNMENT, INPUT_BOTTOM_LIMIT, INPUT_HEAD_AT_TARGET, OUTPUT_DOWNFEED,
+                         OUTPUT_LIFT, USER_MCODES, RuntimeParameter, block_words, evaluate,
+                         parameter_key, parse_program)
+
+ERROR = "error"
+WARNING = "warning"
+
+OUTPUT_NAMES = {OUTPUT_LIFT: "lift", OUTPUT_DOWNFEED: "downfeed"}
+
+# Deepest O-word call nesting followed before giving up
+MAX_CALL_DEPTH = 10
+
+
+class Finding(namedtuple("Finding", "line severity message")):
+    """One problem found in a program (line is 1-based)"""
+
+    def __str__(self):
+        return f"line {self.line}: {self.severity}: {self.message}"
+
+
+class ProgramWalk:
+    """Symbolic machine state while stepping through one program"""
+
+    def __init__(self):
+        self.params = {}
+        self.findings = []
+        self.outputs = {}           # output number -> line it was turned on
+        self.fixed_vice = None      # clamp | open, None = unknown
+        self.moving_vice = None
+        self.spindle = False
+        self.head_target = None
+        # The previous cycle ends with a verified retract, so a program
+        # starts with the head raised; walk() checks this one does too.
+        self.head_raised = True
+        self.ended = False
+
+    def report(self, line, severity, message):
+        self.findings.append(Finding(line, severity, message))
+
+    @property
+    def cutting(self):
+        return OUTPUT_DOWNFEED in self.outputs
+
+    def fork(self):
+        """Copy of the state for a branch that may or may not run
+
+        Findings are shared, so problems on either path are reported.
+        """
+        branch = copy.copy(self)
+        branch.params = dict(self.params)
+        branch.outputs = dict(self.outputs)
+        return branch
+
+    def walk(self, text):
+        try:
+            main, subs = parse_program(text)
+        except ValueError as e:
+            self.report(len(text.splitlines()), ERROR, str(e))
+            return self.findings
+        self.execute(main, subs, 0)
+        last_line = len(text.splitlines())
+        if not self.ended:
+            self.report(last_line, WARNING, "program has no M2/M30")
+            self.end(last_line)
+        return self.findings
+
+    def execute(self, block, subs, depth):
+        """Walk a list of parsed items, returns True on an O-word return"""
+        for number, kind, item in block:
+            if self.ended:
+                return False
+            if kind == "call":
+                if item not in subs:
+                    self.report(number, ERROR, f"call to undefined sub O<{item}>")
+                elif depth >= MAX_CALL_DEPTH:
+                    self.report(number, ERROR, f"O<{item}> nested too deep")
+                else:
+                    self.execute(subs[item], subs, depth + 1)
+            elif kind == "if":
+                if self.branch(number, item, subs, depth):
+                    return True
+            elif kind == "loop":
+                self.report(number, WARNING,
+                            f"O-word {item[0]} loops are not checked; the loop body was skipped")
+            elif kind == "flow":
+                if item == "return":
+                    return True
+            elif kind == "abort":
+                self.abort(number)
+            else:
+                self.block(number, item)
+        return False
+
+    def branch(self, number, branches, subs, depth):
+        """Walk an if/elseif/else block
+
+        Conditions known from the program pick their branch. A condition on
+        a run-time value (such as the #5399 M66 result) is walked on a fork;
+        a branch that ends the program is a guard, anything else is warned
+        about because the paths diverge.
+        """
+        for condition, body in branches:
+            if condition is None:
+                return self.execute(body, subs, depth)
+            try:
+                taken = evaluate(condition, self.params)
+            except RuntimeParameter:
+                fork = self.fork()
+                fork.execute(body, subs, depth)
+                if not fork.ended:
+                    self.report(number, WARNING,
+                                "branch on a run-time value does not end the program; "
+                                "only the path that skips it was checked")
+                continue
+            except ValueError as e:
+                self.report(number, ERROR, str(e))
+                return False
+            if taken:
+                return self.execute(body, subs, depth)
+        return False
+
+    def block(self, number, line):
+        match = ASSIGNMENT.match(line)
+        try:
+            if match:
+                named, numbered, expression = match.groups()
+                self.params[parameter_key(named, numbered)] = evaluate(expression, self.params)
+                return
+            words = block_words(line, self.params)
+        except RuntimeParameter as e:
+            self.report(number, WARNING, f"{e}; block not checked")
+            return
+        except ValueError as e:
+            self.report(number, ERROR, str(e))
+            return
+        values = dict(words)
+        for letter, value in words:
+            if letter == "G" and int(value) in (0, 1, 2, 3) and "Z" in values:
+                self.shuttle_move(number)
+            elif letter == "M":
+                self.m_code(number, int(value), values)
+
+    def shuttle_move(self, number):
+        if self.cutting:
+            self.report(number, ERROR, "shuttle move while downfeed is on")
+        if self.fixed_vice != "clamp" and self.moving_vice != "clamp":
+            self.report(number, ERROR, "shuttle move with both vices open")
+        if not self.head_raised:
+            self.report(number, ERROR, "shuttle move before head is raised above the stock")
+
+    def m_code(self, number, code, values):
+        if code in USER_MCODES:
+            if self.cutting:
+                self.report(number, ERROR, f"M{code} ({USER_MCODES[code]}) during cutting")
+            if code == 101:
+                self.fixed_vice = "clamp"
+            elif code in (102, 103):
+                self.fixed_vice = "open"
+            elif code == 104:
+                self.moving_vice = "clamp"
+            else:
+                self.moving_vice = "open"
+        elif 100 <= code <= 199:
+            self.report(number, ERROR, f"M{code} is not a saw M-code (M101-M105)")
+        elif code == 3:
+            self.spindle = True
+        elif code == 5:
+            if self.cutting:
+                self.report(number, ERROR, "spindle stopped while downfeed is on")
+            self.spindle = False
+        elif code in (64, 65):
+            self.digital_output(number, code, values)
+        elif code == 66:
+            self.wait_input(number, values)
+        elif code in (67, 68):
+            if values.get("E") != 0:
+                self.report(number, WARNING, f"M{code} on analog output other than E0")
+            elif "Q" not in values:
+                self.report(number, ERROR, f"M{code} E0 without a Q height")
+            else:
+                self.head_target = values["Q"]
+        elif code in (2, 30):
+            self.end(number)
+
+    def digital_output(self, number, code, values):
+        output = values.get("P")
+        if output is None:
+            self.report(number, ERROR, f"M{code} without P")
+            return
+        output = int(output)
+        name = OUTPUT_NAMES.get(output, f"P{output}")
+        if code == 65:
+            if self.outputs.pop(output, None) is None:
+                self.report(number, WARNING, f"M65 P{output} but {name} is already off")
+            return
+        if output in self.outputs:
+            self.report(number, WARNING, f"M64 P{output} but {name} is already on")
+        self.outputs[output] = number
+        if OUTPUT_LIFT in self.outputs and OUTPUT_DOWNFEED in self.outputs:
+            self.report(number, ERROR, "lift and downfeed solenoids both on")
+        if output == OUTPUT_DOWNFEED:
+            self.head_raised = False
+            if self.fixed_vice != "clamp":
+                self.report(number, ERROR, "downfeed without the fixed vice clamped")
+            if not self.spindle:
+                self.report(number, ERROR, "downfeed with the blade stopped")
+
+    def wait_input(self, number, values):
+        mode = int(values.get("L", 0))
+        timeout = values.get("Q")
+        if mode != 0 and not timeout:
+            self.report(number, ERROR, "M66 wait with no timeout (Q) can hang forever")
+        if "P" not in values:
+            self.report(number, WARNING, "M66 without P (digital input)")
+            return
+        wanted = int(values["P"])
+        if wanted == INPUT_HEAD_AT_TARGET:
+            if OUTPUT_LIFT not in self.outputs:
+                self.report(number, ERROR, "M66 P0 waits for head height but lift is off")
+            if self.head_target is None:
+                self.report(number, ERROR, "M66 P0 before M67 E0 set a head target")
+            else:
+                height = self.params.get("_material_height")
+                self.head_raised = height is None or self.head_target >= height
+        elif wanted == INPUT_BOTTOM_LIMIT:
+            if OUTPUT_DOWNFEED not in self.outputs:
+                self.report(number, ERROR, "M66 P1 waits for bottom limit but downfeed is off")
+        else:
+            self.report(number, WARNING, f"M66 P{wanted} is not a saw input")
+
+    def abort(self, number):
+        # Outputs set by M64 survive an abort, so a guard must clear them
+        self.ended = True
+        for output in sorted(self.outputs):
+            self.report(number, ERROR,
+                        f"abort leaves M64 P{output} ({OUTPUT_NAMES.get(output, 'output')}) on")
+
+    def end(self, number):
+        self.ended = True
+        for output, on_line in sorted(self.outputs.items()):
+            self.report(on_line, ERROR,
+                        f"M64 P{output} ({OUTPUT_NAMES.get(output, 'output')}) is never turned off by M65 P{output}")
+        if not self.head_raised:
+            self.report(number, ERROR,
+                        "program ends with the head below the stock (retract height too low)")
+
+
+class ProgramChecker:
+    """Checks programs, remembering results by content hash"""
+
+    def __init__(self):
+        self.cache = {}
+
+    @staticmethod
+    def cache_key(text):
+        """Hash of the program with ; comments blanked (line numbers kept)"""
+        code = "\n".join(line.split(";", 1)[0].rstrip() for line in text.splitlines())
+        return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+    def check(self, text):
+        """Findings for a program text (cached)"""
+        key = self.cache_key(text)
+        findings = self.cache.get(key)
+        if findings is None:
+            findings = tuple(ProgramWalk().walk(text))
+            self.cache[key] = findings
+        return findings
+
+    def check_file(self, path):
+        with open(path) as f:
+            return self.check(f.read())
+
+    def check_queue(self, jobs, generator):
+        """Check every job's generated program
+
+        Returns {job_id: findings} for jobs with errors or warnings.
+        """
+        problems = {}
+        for job in jobs:
+            findings = self.check(generator.generate(job))
+            if findings:
+                problems[job["id"]] = findings
+        return problems
+
+
+def has_errors(findings):
+    return any(finding.severity == ERROR for finding in findings)
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Check cut cycle programs before loading")
+    parser.add_argument("files", nargs="*", help=".ngc programs to check")
+    parser.add_argument("--queue", help="check the generated program of every pending job")
+    args = parser.parse_args(argv)
+    if not args.files and not args.queue:
+        parser.error("give .ngc files or --queue")
+
+    checker = ProgramChecker()
+    results = {}
+    for path in args.files:
+        results[path] = checker.check_file(path)
+    if args.queue:
+        from cut_program import CutProgramGenerator
+        from job_queue import JobQueue
+        from material_db import MaterialDB
+        from settings_store import Settings
+
+        queue = JobQueue(args.queue)
+        generator = CutProgramGenerator(Settings(), MaterialDB())
+        results.update(checker.check_queue(queue.pending_jobs(), generator))
+        print(f"Checked {len(queue.pending_jobs())} pending jobs "
+              f"({len(checker.cache)} distinct programs)")
+
+    failed = False
+    for name, findings in results.items():
+        if findings:
+            print(f"{name}:")
+            for finding in findings:
+                print(f"  {finding}")
+        failed = failed or has_errors(findings)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Settings Store for John Sawnders
+Operator settings loaded once into memory and persisted to settings.json
+
+Reads are plain attribute lookups (settings.vice_clamp_dwell). Changes go
+through set(), which notifies subscribers immediately and schedules a
+single debounced write, so a burst of toggles costs one atomic save.
+"""
+
+import json
+import math
+import os
+import threading
+
+from job_queue import write_json_atomic
+
+# Default settings file lives next to the config
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.json")
+
+# Seconds of quiet before changes are written
+SAVE_DELAY = 0.5
+
+# Setting name -> default; the default's type is the setting's type
+DEFAULTS = {
+    "setting1": False,
+    "setting2": False,
+    "setting3": False,
+    "setting4": False,
+    # Cut cycle timing (seconds), see DESIGN_SPEC.md template
+    "vice_clamp_dwell": 1.0,
+    "vice_release_dwell": 0.5,
+    "head_settle_time": 0.5,
+    "spindle_spinup_time": 2.0,
+    # Head clearance above the stock (inches)
+    "clearance": 1.0,
+}
+
+
+class Settings:
+    """Typed settings with debounced atomic persistence"""
+
+    def __init__(self, path=SETTINGS_FILE, save_delay=SAVE_DELAY):
+        """Load settings, falling back to defaults for anything missing
+
+        Args:
+            path: Location of settings.json
+            save_delay: Debounce time for writes in seconds
+        """
+        self._path = path
+        self._save_delay = save_delay
+        self._lock = threading.Lock()
+        self._timer = None
+        self._subscribers = []
+        for name, default in DEFAULTS.items():
+            setattr(self, name, default)
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    stored = json.load(f)
+                if not isinstance(stored, dict):
+                    raise ValueError("not a JSON object")
+            except (OSError, ValueError) as e:
+                print(f"Settings file unreadable, using defaults: {e}")
+                stored = {}
+            # One bad value only costs that setting its stored value
+            for name, value in stored.items():
+                if name not in DEFAULTS:
+                    continue
+                try:
+                    setattr(self, name, self.coerce(name, value))
+                except (TypeError, ValueError) as e:
+                    print(f"Setting {name} invalid ({e}), using default")
+
+    @staticmethod
+    def coerce(name, value):
+        """Convert value to the type of the setting's default"""
+        kind = type(DEFAULTS[name])
+        if value is None:
+            raise TypeError(f"{name} must not be null")
+        if kind is bool and isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        if kind is float:
+            number = float(value)
+            if not math.isfinite(number):
+                raise ValueError(f"{name} must be a finite number")
+            return number
+        return kind(value)
+
+    def as_dict(self):
+        """Current values of every setting"""
+        return {name: getattr(self, name) for name in DEFAULTS}
+
+    def subscribe(self, callback):
+        """Call callback(name, value) whenever a setting changes"""
+        self._subscribers.append(callback)
+
+    def set(self, name, value):
+        """Change a setting, notify subscribers and schedule a save"""
+        if name not in DEFAULTS:
+            raise KeyError(f"unknown setting {name}")
+        value = self.coerce(name, value)
+        if getattr(self, name) == value:
+            return
+        setattr(self, name, value)
+        self.schedule_save()
+        for callback in self._subscribers:
+            try:
+                callback(name, value)
+            except Exception as e:
+                print(f"Error in settings subscriber: {e}")
+
+    def update(self, values):
+        """Change several settings at once"""
+        for name, value in values.items():
+            self.set(name, value)
+
+    def schedule_save(self):
+        """(Re)start the debounce timer"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self._save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write settings now if a save is pending"""
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+            self._timer = None
+            try:
+                write_json_atomic(self._path, self.as_dict())
+            except OSError as e:
+                print(f"Error saving settings: {e}")
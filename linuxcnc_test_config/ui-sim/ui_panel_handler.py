@@ -8,8 +8,29 @@ from PyQt5.QtCore import Qt, QTimer, pyqtSlot
 from PyQt5.QtWidgets import QMessageBox, QDialog
 from PyQt5.QtGui import QColor
 import linuxcnc
+import copy
 import sys
 import os
+import threading
+
+from job_queue import JobQueue
+from job_service import DEFAULT_HOST, DEFAULT_PORT, JobService, read_service_config
+from cutlist_import import read_cut_limit
+from config_update import Updater, open_source, read_update_config
+from dispatch import DispatchClient, SawAgent, read_dispatch_config
+from maintenance import MaintenanceCounters, ACTUATION_PINS
+from material_db import MaterialDB, stock_height
+from settings_store import Settings
+from cut_program import SLOWEST_DOWNFEED_RATE, CutProgramGenerator
+from gcode_view import GcodeView
+from program_check import ERROR, ProgramChecker, has_errors
+
+# Modules shared between the configs (readout widget)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from smooth_readout import SmoothReadout
+
+# Program file for work leased from the dispatcher (a runtime temp_*.ngc)
+LEASE_PROGRAM = "temp_lease.ngc"
 
 # LinuxCNC interfaces
 STAT = linuxcnc.stat()
@@ -41,23 +62,88 @@ class HandlerClass:
         self.hal.newpin("unclamp-mv", self.hal.HAL_BIT, self.hal.HAL_OUT)
         self.hal.newpin("cut-active", self.hal.HAL_BIT, self.hal.HAL_OUT)
 
+        # Solenoid and vice valve outputs (netted in postgui.hal) for maintenance counts
+        for pin in ACTUATION_PINS:
+            self.hal.newpin(pin, self.hal.HAL_BIT, self.hal.HAL_IN)
+
+        # Loaded job's stock height (in) and downfeed rate (in/min) for the plant model
+        self.hal.newpin("material-height", self.hal.HAL_FLOAT, self.hal.HAL_OUT)
+        self.hal.newpin("cut-rate", self.hal.HAL_FLOAT, self.hal.HAL_OUT)
+
         # Status tracking
+        self.loaded_file = None     # last program tried in the viewer, loaded or not
+        self.loaded_mtime = None
+        self.stock_file = None      # program whose stock is on the plant pins
         self.program_running = False
         self.program_paused = False
         self.machine_on = False
+        self.run_file = None        # program of the auto run in progress
+        self.run_aborted = False
 
         # Timer for periodic updates
         self.update_timer = QTimer()
         self.update_timer.timeout.connect(self.periodic_update)
         self.update_timer.start(100)  # Update every 100ms
 
-        # Settings storage (in real app, would persist to file)
-        self.settings = {
-            'setting1': False,
-            'setting2': False,
-            'setting3': False,
-            'setting4': False
-        }
+        # Settings are loaded once; changes are saved in the background
+        self.settings = Settings()
+        self.saved_settings = self.settings.as_dict()
+
+        # Generated programs pick up timing changes through a settings subscription;
+        # cut timeouts come from the material downfeed rates (slowest rate if the
+        # material database cannot be read)
+        try:
+            self.materials = MaterialDB()
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Material database not loaded: {e}")
+            self.materials = None
+        self.program_generator = CutProgramGenerator(self.settings, self.materials)
+        self.program_checker = ProgramChecker()
+
+        # Job queue and local submission service (runs in its own threads)
+        self.job_queue = JobQueue()
+        self.job_service = None
+
+        # Blade and hydraulic maintenance totals, updated as pieces complete
+        self.maintenance = MaintenanceCounters()
+        self.job_queue.subscribe(self.maintenance.on_piece_complete)
+
+        # Pending jobs are checked in the background whenever jobs are added or
+        # settings change; Start only checks the loaded program
+        self.queue_problems = {}
+        self.queue_check_wanted = threading.Event()
+        self.job_queue.subscribe_added(self.request_queue_check)
+        self.settings.subscribe(self.request_queue_check)
+        threading.Thread(target=self.queue_check_worker, name="queue-check",
+                         daemon=True).start()
+        self.request_queue_check()
+        ini_path = os.environ.get("INI_FILE_NAME")
+        try:
+            host, port = read_service_config(ini_path) if ini_path else (DEFAULT_HOST, DEFAULT_PORT)
+            self.job_service = JobService(self.job_queue, host, port, cut_limit=read_cut_limit())
+            self.job_service.start()
+        except Exception as e:
+            print(f"Job service not started: {e}")
+
+        # Config updates are staged in the background and applied between jobs
+        self.updater = None
+        self.update_ready = False
+        if ini_path:
+            update_source, update_root = read_update_config(ini_path)
+            if update_source and update_root:
+                self.updater = Updater(update_root)
+                threading.Thread(target=self.stage_update, args=(update_source,),
+                                 daemon=True).start()
+
+        # Shared job pool: a background agent claims work from the dispatcher
+        self.saw_agent = None
+        self.leased_program = None
+        self.leased_job = None
+        if ini_path:
+            dispatch_server, saw_id, blade = read_dispatch_config(ini_path)
+            if dispatch_server:
+                self.saw_agent = SawAgent(DispatchClient(dispatch_server, saw_id), blade)
+                self.saw_agent.start()
 
     def initialized__(self):
         """Called after UI is fully loaded"""
@@ -85,6 +171,9 @@ class HandlerClass:
         # Connect Settings buttons
         self.w.saveButton.clicked.connect(self.on_save_settings)
         self.w.cancelButton.clicked.connect(self.on_cancel_settings)
+        self.w.bladeChangedButton.clicked.connect(self.on_blade_changed)
+        self.w.hydraulicServiceButton.clicked.connect(self.on_hydraulic_serviced)
+        self.update_maintenance_display()
 
         # Connect settings toggles
         self.w.setting1Toggle.stateChanged.connect(lambda state: self.on_setting_changed('setting1', state))
@@ -92,6 +181,22 @@ class HandlerClass:
         self.w.setting3Toggle.stateChanged.connect(lambda state: self.on_setting_changed('setting3', state))
         self.w.setting4Toggle.stateChanged.connect(lambda state: self.on_setting_changed('setting4', state))
 
+        # Show stored settings
+        self.load_settings_toggles()
+
+        # Swap the static preview for the virtualized viewer
+        self.gcode_view = GcodeView()
+        self.gcode_view.setSizePolicy(self.w.gcodePreview.sizePolicy())
+        self.w.gcodePreview.parentWidget().layout().replaceWidget(self.w.gcodePreview,
+                                                                   self.gcode_view)
+        self.w.gcodePreview.hide()
+        STAT.poll()
+        self.update_gcode_preview()
+
+        # Readouts extrapolate between polls and repaint only while moving
+        self.head_height_readout = SmoothReadout(self.w.headHeightReadout, '{:.3f}"   Head Height')
+        self.z_axis_readout = SmoothReadout(self.w.zAxisReadout, '{:.3f}"   Z Axis')
+
         # Tab change handler
         self.w.tabWidget.currentChanged.connect(self.on_tab_changed)
 
@@ -110,6 +215,11 @@ class HandlerClass:
                     self.program_paused = False
                     print("Program resumed")
                 else:
+                    # Refuse to start if the program or any queued job fails the check
+                    problems = self.check_programs()
+                    if problems:
+                        self.show_error("Program check failed", problems)
+                        return
                     # Start new program
                     COMMAND.mode(linuxcnc.MODE_AUTO)
                     COMMAND.wait_complete()
@@ -138,6 +248,7 @@ class HandlerClass:
         print("Stop button clicked")
         try:
             COMMAND.abort()
+            self.run_aborted = True
             self.program_running = False
             self.program_paused = False
             print("Program stopped")
@@ -170,37 +281,41 @@ class HandlerClass:
         """Handle Clamp Fixed Vice button"""
         print("Clamp Fixed Vice clicked")
         self.hal["clamp-fv"] = True
-        QTimer.singleShot(1000, lambda: setattr(self.hal, "clamp-fv", False))
+        QTimer.singleShot(1000, lambda: self.release_pin("clamp-fv"))
         self.show_info("Vice Control", "Fixed Vice Clamped")
 
     def on_unclamp_fv_clicked(self):
         """Handle Unclamp Fixed Vice button"""
         print("Unclamp Fixed Vice clicked")
         self.hal["unclamp-fv"] = True
-        QTimer.singleShot(1000, lambda: setattr(self.hal, "unclamp-fv", False))
+        QTimer.singleShot(1000, lambda: self.release_pin("unclamp-fv"))
         self.show_info("Vice Control", "Fixed Vice Unclamped")
 
     def on_clamp_mv_clicked(self):
         """Handle Clamp Moving Vice button"""
         print("Clamp Moving Vice clicked")
         self.hal["clamp-mv"] = True
-        QTimer.singleShot(1000, lambda: setattr(self.hal, "clamp-mv", False))
+        QTimer.singleShot(1000, lambda: self.release_pin("clamp-mv"))
         self.show_info("Vice Control", "Moving Vice Clamped")
 
     def on_unclamp_mv_clicked(self):
         """Handle Unclamp Moving Vice button"""
         print("Unclamp Moving Vice clicked")
         self.hal["unclamp-mv"] = True
-        QTimer.singleShot(1000, lambda: setattr(self.hal, "unclamp-mv", False))
+        QTimer.singleShot(1000, lambda: self.release_pin("unclamp-mv"))
         self.show_info("Vice Control", "Moving Vice Unclamped")
 
     def on_cut_clicked(self):
         """Handle Cut button in Manual Mode"""
         print("Cut! button clicked")
         self.hal["cut-active"] = True
-        QTimer.singleShot(2000, lambda: setattr(self.hal, "cut-active", False))
+        QTimer.singleShot(2000, lambda: self.release_pin("cut-active"))
         self.show_info("Manual Operation", "Cutting operation started")
 
+    def release_pin(self, pin):
+        """End a momentary output pulse"""
+        self.hal[pin] = False
+
     def on_manual_stop_clicked(self):
         """Handle Stop button in Manual Mode"""
         print("Manual Stop clicked")
@@ -213,25 +328,43 @@ class HandlerClass:
     # Settings handlers
     def on_setting_changed(self, setting_name, state):
         """Handle settings toggle change"""
-        self.settings[setting_name] = (state == Qt.Checked)
-        print(f"Setting {setting_name} changed to {self.settings[setting_name]}")
+        self.settings.set(setting_name, state == Qt.Checked)
+        print(f"Setting {setting_name} changed to {getattr(self.settings, setting_name)}")
 
     def on_save_settings(self):
         """Handle Save button in Settings"""
         print("Saving settings...")
-        # In a real application, would save to file
+        self.settings.flush()
+        self.saved_settings = self.settings.as_dict()
         self.show_info("Settings", "Settings saved successfully")
 
     def on_cancel_settings(self):
         """Handle Cancel button in Settings"""
         print("Canceling settings changes...")
-        # Reset toggles to saved values
-        self.w.setting1Toggle.setChecked(self.settings.get('setting1', False))
-        self.w.setting2Toggle.setChecked(self.settings.get('setting2', False))
-        self.w.setting3Toggle.setChecked(self.settings.get('setting3', False))
-        self.w.setting4Toggle.setChecked(self.settings.get('setting4', False))
+        # Restore the values from the last Save
+        self.settings.update(self.saved_settings)
+        self.load_settings_toggles()
         self.show_info("Settings", "Changes canceled")
 
+    def load_settings_toggles(self):
+        """Set the toggles from the settings store"""
+        self.w.setting1Toggle.setChecked(self.settings.setting1)
+        self.w.setting2Toggle.setChecked(self.settings.setting2)
+        self.w.setting3Toggle.setChecked(self.settings.setting3)
+        self.w.setting4Toggle.setChecked(self.settings.setting4)
+
+    def on_blade_changed(self):
+        """Handle Blade Changed button in Settings"""
+        print("Blade change recorded")
+        self.maintenance.reset_blade()
+        self.update_maintenance_display()
+
+    def on_hydraulic_serviced(self):
+        """Handle Hydraulics Serviced button in Settings"""
+        print("Hydraulic service recorded")
+        self.maintenance.reset_hydraulics()
+        self.update_maintenance_display()
+
     def on_tab_changed(self, index):
         """Handle tab change"""
         tab_names = ["Auto Mode", "Manual Mode", "Settings"]
@@ -239,26 +372,198 @@ class HandlerClass:
 
         # Update UI based on current tab
         if index == 0:  # Auto Mode
+            STAT.poll()
             self.update_gcode_preview()
         elif index == 1:  # Manual Mode
             self.update_position_readouts()
 
+    def request_queue_check(self, *args):
+        """Ask the worker to re-check pending jobs (queue and settings subscriber)"""
+        self.queue_check_wanted.set()
+
+    def queue_check_worker(self):
+        """Check every pending job's program off the Qt thread
+
+        Results are cached by program, so only new geometry is walked.
+        """
+        while True:
+            self.queue_check_wanted.wait()
+            self.queue_check_wanted.clear()
+            try:
+                with self.job_queue.lock:
+                    jobs = copy.deepcopy(self.job_queue.pending_jobs())
+                self.queue_problems = self.program_checker.check_queue(jobs,
+                                                                       self.program_generator)
+            except Exception as e:
+                print(f"Error checking queued programs: {e}")
+
+    def check_programs(self):
+        """Check the loaded program before the first piece
+
+        Pending jobs come from the last background check. Returns a report
+        of errors, or None if everything passed.
+        """
+        results = dict(self.queue_problems)
+        if STAT.file and STAT.file.endswith(".ngc"):
+            results[os.path.basename(STAT.file)] = self.program_checker.check_file(STAT.file)
+        lines = []
+        for name, findings in results.items():
+            for finding in findings:
+                print(f"{name}: {finding}")
+            if has_errors(findings):
+                lines.append(f"{name}:")
+                lines.extend(f"  {finding}" for finding in findings if finding.severity == ERROR)
+        return "\n".join(lines) or None
+
     # Update methods
     def periodic_update(self):
         """Periodic status update"""
         try:
             STAT.poll()
 
+            # Follow program runs however they were started
+            self.track_program_run()
+
+            # Model the loaded job's stock in the sim plant
+            self.update_plant_stock()
+
             # Update status chips
             self.update_status_indicators()
 
+            # Follow the executing line if on Auto tab
+            if self.w.tabWidget.currentIndex() == 0:
+                self.update_gcode_preview()
+                self.gcode_view.set_current_line(STAT.motion_line)
+
             # Update position readouts if on Manual tab
             if self.w.tabWidget.currentIndex() == 1:
                 self.update_position_readouts()
 
+            # Maintenance totals (running sums only, no history scan)
+            self.maintenance.update_spindle(STAT.spindle[0]['enabled'])
+            self.maintenance.update_pins({pin: self.hal[pin] for pin in ACTUATION_PINS})
+            self.maintenance.save()
+            if self.w.tabWidget.currentIndex() == 2:
+                self.update_maintenance_display()
+
+            # Load work leased from the dispatcher between runs; only in Auto,
+            # never while the operator is jogging or in MDI
+            if (self.saw_agent and STAT.interp_state == linuxcnc.INTERP_IDLE
+                    and STAT.task_mode == linuxcnc.MODE_AUTO):
+                lease = self.saw_agent.take_new_lease()
+                if lease:
+                    self.load_leased_job(lease)
+
+            # Never switch configs mid-program (subroutines resolve through `current`)
+            if self.update_ready and STAT.interp_state == linuxcnc.INTERP_IDLE:
+                self.apply_update()
+
         except Exception as e:
             pass  # Silently handle errors in periodic update
 
+    def track_program_run(self):
+        """Follow auto runs from STAT and count a piece when one finishes"""
+        idle = STAT.interp_state == linuxcnc.INTERP_IDLE
+        if not idle and self.run_file is None and STAT.task_mode == linuxcnc.MODE_AUTO:
+            self.run_file = STAT.file
+            self.run_aborted = False
+            self.program_running = True
+        elif idle and self.run_file is not None:
+            # Stop, E-stop or a program error is not a finished piece
+            finished = (not self.run_aborted and STAT.task_state == linuxcnc.STATE_ON
+                        and STAT.state != linuxcnc.RCS_ERROR)
+            run_file, self.run_file = self.run_file, None
+            self.program_running = False
+            self.program_paused = False
+            self.update_button_states()
+            if finished:
+                self.on_program_finished(run_file)
+
+    def load_leased_job(self, lease):
+        """Write and open the program for a job leased from the dispatcher
+
+        The file name is fixed (LEASE_PROGRAM); the remote job's nc_file is
+        never used as a path.
+        """
+        try:
+            directory = os.path.dirname(os.path.abspath(__file__))
+            job = dict(lease["job"], nc_file=LEASE_PROGRAM)
+            self.leased_program = self.program_generator.write(job, directory)
+            self.leased_job = job
+            self.stock_file = None  # same file name, new stock
+            COMMAND.program_open(self.leased_program)
+            print(f"Leased {lease['pieces']} pieces of {lease['job_id']} ({lease['lease_id']})")
+        except Exception as e:
+            print(f"Error loading leased job: {e}")
+
+    def job_for_program(self, path):
+        """The leased or pending job whose generated program is path, or None"""
+        if path and path == self.leased_program:
+            return self.leased_job
+        name = os.path.basename(path or "")
+        for job in self.job_queue.pending_jobs():
+            if job["nc_file"] == name:
+                return job
+        return None
+
+    def update_plant_stock(self):
+        """Put the loaded job's stock height and downfeed rate on the plant pins"""
+        if STAT.file == self.stock_file:
+            return
+        self.stock_file = STAT.file
+        job = self.job_for_program(STAT.file)
+        if job is None:
+            return
+        metadata = job["metadata"]
+        self.hal["material-height"] = stock_height(metadata["material_shape"],
+                                                   metadata["stock_dimensions"])
+        recommendation = None
+        if self.materials is not None:
+            recommendation = self.materials.recommend(metadata.get("material_type") or "",
+                                                      metadata["material_shape"])
+        self.hal["cut-rate"] = (recommendation["downfeed_rate"] if recommendation
+                                else SLOWEST_DOWNFEED_RATE)
+
+    def on_program_finished(self, path):
+        """Count one piece for the job whose program just ran
+
+        Only a queued job's own program counts; ad-hoc and test programs
+        are not pieces of whatever job happens to be active.
+        """
+        if self.saw_agent and path == self.leased_program:
+            self.saw_agent.piece_done()
+            return
+        job = self.job_for_program(path)
+        if job is None:
+            return
+        job_id = job["id"]
+        try:
+            job = self.job_queue.complete_piece(job_id)
+            print(f"Job {job_id}: {job['completed_qty']}/{job['total_qty']} pieces")
+        except Exception as e:
+            print(f"Error recording piece: {e}")
+
+    def stage_update(self, source):
+        """Download and stage a config update (background thread)"""
+        try:
+            stats = self.updater.stage(open_source(source))
+            if stats:
+                print(f"Config update {stats['id']} staged: fetched {stats['bytes_fetched']} bytes")
+                self.update_ready = True
+        except Exception as e:
+            print(f"Config update failed: {e}")
+
+    def apply_update(self):
+        """Switch to the staged config, only while no program is running"""
+        self.update_ready = False
+        try:
+            if self.updater.apply():
+                print(f"Config update {self.updater.current_id()} applied")
+                self.show_info("Config Update",
+                               "Configuration updated. Restart LinuxCNC to load INI/HAL changes.")
+        except Exception as e:
+            print(f"Error applying config update: {e}")
+
     def update_status_indicators(self):
         """Update the status indicator chips"""
         try:
@@ -312,19 +617,50 @@ class HandlerClass:
     def update_position_readouts(self):
         """Update position displays in Manual Mode"""
         try:
-            # Get current position
+            # Get current position and velocity
             z_pos = STAT.position[2]  # Z axis position
+            z_vel = STAT.joint[2]['velocity']  # trivkins: joint 2 is Z
+
+            # Update readouts (they interpolate until the next poll)
+            self.head_height_readout.set_sample(z_pos, z_vel)
+            self.z_axis_readout.set_sample(z_pos, z_vel)
+        except Exception as e:
+            pass
 
-            # Update readouts
-            self.w.headHeightReadout.setText(f"{z_pos:.3f}\"   Head Height")
-            self.w.zAxisReadout.setText(f"{z_pos:.3f}\"   Z Axis")
+    def update_maintenance_display(self):
+        """Update maintenance totals in Settings"""
+        try:
+            self.w.maintenanceLabel.setText(self.maintenance.summary())
+            due = self.maintenance.blade_due() or self.maintenance.hydraulic_due()
+            self.w.maintenanceFrame.setStyleSheet(
+                f"background-color: {'#b83219' if due else '#a5a5a5'}; border-radius: 20px;")
         except Exception as e:
             pass
 
     def update_gcode_preview(self):
-        """Update G-code preview in Auto Mode"""
-        # In a real implementation, would load and display actual G-code
-        pass
+        """Load the current program into the G-code viewer in Auto Mode
+
+        Uses the last STAT.poll(). Reloads when another file is opened or
+        the file changes on disk (a regenerated temp_*.ngc keeps its name).
+        The path and mtime are recorded before loading, so a file that
+        fails is tried once per change, not on every update.
+        """
+        path = STAT.file
+        if not path:
+            return
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if path == self.loaded_file and mtime == self.loaded_mtime:
+            return
+        self.loaded_file = path
+        self.loaded_mtime = mtime
+        try:
+            self.gcode_view.load(path)
+            print(f"Loaded {path} into G-code viewer")
+        except Exception as e:
+            print(f"Error loading G-code preview: {e}")
 
     # Helper methods for dialogs
     def show_info(self, title, message):
@@ -361,6 +697,12 @@ class HandlerClass:
         """Called when the UI is closing"""
         print("UI Panel Handler shutting down...")
         self.update_timer.stop()
+        self.maintenance.save(force=True)
+        self.settings.flush()
+        if self.job_service:
+            self.job_service.stop()
+        if self.saw_agent:
+            self.saw_agent.stop()
 
 def get_handlers(halcomp, widgets, paths):
     """Required function that returns handler instances"""